@@ -2,3 +2,31 @@ bind = "0.0.0.0:5000"
 workers = 4
 threads = 4
 timeout = 120
+
+
+def post_worker_init(worker):
+    # fill the content cache in the background, the worker serves requests meanwhile and a failure is only logged
+    app = worker.wsgi
+    if app.config.get('CACHE_WARM_ON_START', True):
+        from threading import Thread
+        Thread(target=_warm, args=(worker, app), name='cache-warm', daemon=True).start()
+
+
+def _warm(worker, app):
+    from server.common.content import warm_content
+    try:
+        with app.app_context():
+            loaded, rendered = warm_content(app.config.get('CACHE_WARM_PAGES'))
+    except Exception:
+        worker.log.exception('Warming the content cache failed')
+        return
+    worker.log.info('Warmed the content cache with %d pages from the snapshot and %d rendered pages',
+                    loaded, rendered)
+
+
+def worker_exit(server, worker):
+    app = getattr(worker, 'wsgi', None)
+    if app is not None:
+        from server.common.content import save_snapshot
+        with app.app_context():
+            save_snapshot()
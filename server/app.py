@@ -4,11 +4,15 @@ from flask import Flask
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 from server.common.bcrypt import bcrypt
+from server.common.content import content_cache, revision_cache
 from server.common.cors import cors
 from server.common.database import setup as setup_db
 from server.common.database.ref import db
 from server.common.doc import doc
+from server.common.invalidation import bus
 from server.common.jwt.ref import jwt
+from server.common.media import media_processor, derived_cache
+from server.common.response_cache import response_cache
 from server.common.schema.ref import ma, marshmallow_plugin
 from server.common.tinify import tinify
 from server.config import setup_config
@@ -24,6 +28,12 @@ def init_extensions(app: Flask):
     ma.init_app(app)
     bcrypt.init_app(app)
     tinify.init_app(app)
+    media_processor.init_app(app)
+    derived_cache.init_app(app)
+    content_cache.init_app(app)
+    revision_cache.init_app(app)
+    bus.init_app(app)
+    response_cache.init_app(app)
 
 
 def create_app(name=__name__):
@@ -34,6 +44,8 @@ def create_app(name=__name__):
     setup_logging_config(app)
     init_extensions(app)
     setup_db(app)
+    from server.cli import setup_cli
+    setup_cli(app)
     from server.common.util.register import register_resources
     register_resources(api, doc, app, marshmallow_plugin)
 
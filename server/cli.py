@@ -0,0 +1,160 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import Flask, current_app
+from flask.cli import AppGroup
+
+from server.common.content import apply_change, compact_history, diff_content, page_changes, warm_content, \
+    save_snapshot
+from server.common.database import db, Change, Media, Page
+from server.common.media import media_processor
+from server.common.util.file import get_save_path
+
+__all__ = ['setup_cli']
+
+content_cli = AppGroup('content', help='Manage the content history of the pages')
+media_cli = AppGroup('media', help='Manage the processing of uploaded media')
+
+
+@content_cli.command('migrate-deltas')
+@click.option('--batch-size', default=500, show_default=True, help='Number of changes converted per transaction')
+def migrate_deltas(batch_size):
+    """
+    Convert changes stored as lists of (operation, text) pairs to compact deltas
+
+    The history of every page is replayed and each legacy change is replaced by the delta between the texts before
+    and after it. Legacy changes were applied as fuzzy patches, often to text that did not match the one they were
+    made on, so their pairs can not be converted to a strict delta directly.
+    """
+    key = (Page.category, Page.id)
+    last = None
+    converted = 0
+    while True:
+        query = db.session.query(*key).order_by(*key)
+        if last:
+            query = query.filter(db.tuple_(*key) > last)
+        page = query.first()
+        if not page:
+            break
+        converted += migrate_page_deltas(*page, batch_size)
+        last = tuple(page)
+    click.echo(f'Converted {converted} changes')
+
+
+def migrate_page_deltas(category_id, page_id, batch_size):
+    content = ''
+    last = None
+    converted = 0
+    while True:
+        query = page_changes(category_id, page_id)
+        if last:
+            query = query.filter(Change.created_at > last)
+        changes = query.limit(batch_size).all()
+        if not changes:
+            break
+        for change in changes:
+            new_content = apply_change(content, change.data)
+            if not isinstance(change.data, str):
+                change.data = diff_content(content, new_content)
+                converted += 1
+            content = new_content
+        last = changes[-1].created_at
+        db.session.commit()
+        db.session.expunge_all()
+    return converted
+
+
+def compact_pages(cutoff, batch_size):
+    key = (Page.category, Page.id)
+    last = None
+    removed = 0
+    while True:
+        query = Page.query.order_by(*key)
+        if last:
+            query = query.filter(db.tuple_(*key) > last)
+        page = query.with_for_update().first()
+        if not page:
+            break
+        removed += compact_history(page, cutoff, batch_size)
+        last = (page.category, page.id)
+        db.session.commit()
+        db.session.expunge_all()
+    return removed
+
+
+@content_cli.command('compact')
+@click.option('--retention-days', type=int, default=None,
+              help='Keep the changes of this many days, defaults to CONTENT_RETENTION_DAYS')
+@click.option('--batch-size', default=500, show_default=True, help='Number of changes replayed per query')
+@click.option('--every', type=int, default=None, help='Keep running and compact every this many seconds')
+def compact(retention_days, batch_size, every):
+    """
+    Squash the changes older than the retention window into a single baseline change per page
+    """
+    if retention_days is None:
+        retention_days = current_app.config.get('CONTENT_RETENTION_DAYS', 365)
+    while True:
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+        removed = compact_pages(cutoff, batch_size)
+        click.echo(f'Removed {removed} changes made before {cutoff.isoformat(sep=" ")}')
+        if not every:
+            break
+        time.sleep(every)
+
+
+@content_cli.command('warm')
+@click.option('--limit', type=int, default=None, help='Render only this many of the most requested pages')
+@click.option('--all', 'all_pages', is_flag=True, help='Render all pages, ignoring CACHE_WARM_PAGES')
+def warm(limit, all_pages):
+    """
+    Fill the content cache from the snapshot and render the most requested pages that are still missing
+    """
+    if limit is None and not all_pages:
+        limit = current_app.config.get('CACHE_WARM_PAGES')
+    loaded, rendered = warm_content(limit)
+    click.echo(f'Loaded {loaded} pages from the snapshot and rendered {rendered} pages')
+
+
+@content_cli.command('snapshot')
+def snapshot():
+    """
+    Write the cached content and request counts of the pages to the snapshot file
+    """
+    click.echo(f'Wrote {save_snapshot()} pages to the snapshot')
+
+
+@media_cli.command('process')
+@click.option('--limit', type=int, default=None, help='Process at most this many jobs')
+def process(limit):
+    """
+    Process the pending media jobs in the foreground, for nodes that run without MEDIA_WORKERS
+    """
+    click.echo(f'Processed {media_processor.process_pending(limit)} media jobs')
+
+
+@media_cli.command('render')
+@click.option('--missing', is_flag=True, help='Only queue the images that lack one of the variants')
+def render(missing):
+    """
+    Queue the rendering of the variants for the images in the media library
+    """
+    queued = 0
+    for media in Media.query.filter(Media.mimetype.like('image/%')).order_by(Media.__table__.c.id):
+        if media.jobs:
+            continue
+        if missing:
+            save_path = get_save_path('image')
+            if all(os.path.exists(os.path.join(save_path, media.get_file_name(suffix)))
+                   for suffix in media_processor.variants):
+                continue
+        media_processor.enqueue(media)
+        queued += 1
+    db.session.commit()
+    click.echo(f'Queued {queued} images, they are rendered by the workers or by flask media process')
+
+
+def setup_cli(app: Flask):
+    app.cli.add_command(content_cli)
+    app.cli.add_command(media_cli)
@@ -0,0 +1,546 @@
+import hashlib
+import os
+import pickle
+import time
+from collections import namedtuple, Counter
+from contextlib import contextmanager
+from datetime import timezone
+from functools import partial
+from threading import Lock
+
+from diff_match_patch.diff_match_patch import diff_match_patch
+from flask import current_app, abort
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from server.common.database import db
+from server.common.database.change import Change
+from server.common.database.checkpoint import Checkpoint
+from server.common.database.page import Page
+from server.common.invalidation import bus
+from server.common.util import CacheDict
+from server.common.util.metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows, which gunicorn does not run on either
+    fcntl = None
+
+__all__ = ['diff_maker', 'content_cache', 'revision_cache', 'RenderedContent', 'rendered', 'get_content',
+           'make_delta', 'diff_content', 'apply_delta', 'patch_to_delta', 'apply_change', 'render_content',
+           'render_revision', 'revision_at', 'add_change', 'compact_history', 'save_snapshot', 'load_snapshot',
+           'warm_content', 'evict_content', 'read_content', 'content_written']
+
+diff_maker = diff_match_patch()
+
+RenderedContent = namedtuple('RenderedContent', ('text', 'etag'))
+
+
+def rendered(text):
+    return RenderedContent(text, hashlib.sha256(text.encode('utf_8')).hexdigest())
+
+
+def _page_filter(model, category_id, page_id):
+    return model.category == category_id, model.page == page_id
+
+
+def make_delta(diffs):
+    # the lengths in a delta are UTF-16 code units since diff-match-patch 20230430 and code points before,
+    # requirements.txt pins a version that writes the stored format
+    return diff_maker.diff_toDelta(diffs)
+
+
+def diff_content(old, new):
+    """
+    Diff two versions of a page and return the delta between them
+
+    Documents larger than CONTENT_DIFF_LINE_THRESHOLD characters are diffed line by line, which is much cheaper than
+    the character level diff and does not run into the timeout on large pages.
+    """
+    config = current_app.config
+    maker = diff_match_patch()
+    line_mode = len(old) + len(new) > config.get('CONTENT_DIFF_LINE_THRESHOLD', 20000)
+    start = time.perf_counter()
+    if line_mode:
+        maker.Diff_Timeout = config.get('CONTENT_DIFF_LINE_TIMEOUT', 2.0)
+        old_chars, new_chars, lines = maker.diff_linesToChars(old, new)
+        diffs = maker.diff_main(old_chars, new_chars, False)
+        maker.diff_charsToLines(diffs, lines)
+    else:
+        maker.Diff_Timeout = config.get('CONTENT_DIFF_TIMEOUT', 0.5)
+        diffs = maker.diff_main(old, new)
+    elapsed = time.perf_counter() - start
+    if maker.Diff_Timeout and elapsed >= maker.Diff_Timeout:
+        metrics.increment('content.diff.timeouts')
+    maker.diff_cleanupEfficiency(diffs)
+    metrics.observe('content.diff.seconds', time.perf_counter() - start)
+    delta = make_delta(diffs)
+    metrics.increment('content.diff.line_mode' if line_mode else 'content.diff.char_mode')
+    metrics.observe('content.diff.size', len(delta))
+    return delta
+
+
+def apply_delta(content, delta):
+    return diff_maker.diff_text2(diff_maker.diff_fromDelta(content, delta))
+
+
+def _utf16_length(text):
+    return len(text.encode('utf_16_le')) // 2
+
+
+def _from_utf16_offset(text, offset):
+    return len(text.encode('utf_16_le')[:offset * 2].decode('utf_16_le', errors='ignore'))
+
+
+def _produced_tail(diffs, length, utf16=False):
+    """
+    Get the last length characters, or UTF-16 code units, of the text the diffs produce
+    """
+    parts, size = [], 0
+    for op, text in reversed(diffs):
+        if size >= length:
+            break
+        if op != diff_maker.DIFF_DELETE:
+            parts.append(text)
+            size += _utf16_length(text) if utf16 else len(text)
+    if size < length:
+        return None
+    tail = ''.join(reversed(parts))
+    if utf16:
+        return tail[len(tail) - _from_utf16_offset(tail[::-1], length):] if length else ''
+    return tail[len(tail) - length:]
+
+
+def _patch_start(diffs, content, position, produced, produced_utf16, patch, old_text):
+    """
+    Find where the patch starts in the text produced so far followed by the rest of the content
+    """
+    for utf16 in (False, True):
+        if utf16:
+            if patch.start1 >= produced_utf16:
+                start = produced + _from_utf16_offset(content[position:], patch.start1 - produced_utf16)
+            else:
+                tail = _produced_tail(diffs, produced_utf16 - patch.start1, utf16=True)
+                start = produced - len(tail) if tail is not None else -1
+        else:
+            start = patch.start1
+        overlap = produced - start
+        if start < 0 or overlap > len(old_text):
+            continue
+        if overlap > 0:
+            tail = _produced_tail(diffs, overlap)
+            if tail == old_text[:overlap] and content.startswith(old_text[overlap:], position):
+                return start, produced_utf16 - _utf16_length(tail)
+        elif content.startswith(old_text, position - overlap):
+            return start, produced_utf16 + _utf16_length(content[position:position - overlap])
+    raise ValueError('The patch does not apply to the content')
+
+
+def patch_to_delta(content, patch_text):
+    """
+    Turn a patch made on content into a delta without diffing the documents again
+
+    Every patch is made on the text with the previous patches applied and has to match it exactly at its offset,
+    which is counted in code points by this library and in UTF-16 code units by the JavaScript one.
+    """
+    diffs = []
+    position = produced = produced_utf16 = 0
+    for patch in diff_maker.patch_fromText(patch_text):
+        old_text, new_text = diff_maker.diff_text1(patch.diffs), diff_maker.diff_text2(patch.diffs)
+        start, start_utf16 = _patch_start(diffs, content, position, produced, produced_utf16, patch, old_text)
+        patch_diffs = list(patch.diffs)
+        overlap = produced - start
+        if overlap <= 0:
+            diffs.append((diff_maker.DIFF_EQUAL, content[position:position - overlap]))
+            position -= overlap
+        else:
+            # the leading context of the patch was already produced by the previous one, where the patch changes the
+            # trailing context of the previous patch that context is handed back to it
+            lead = len(patch_diffs[0][1]) if patch_diffs[0][0] == diff_maker.DIFF_EQUAL else 0
+            rewind = max(overlap - lead, 0)
+            position -= rewind
+            while rewind > 0:
+                op, text = diffs.pop()
+                if op != diff_maker.DIFF_EQUAL:
+                    raise ValueError('The patch does not apply to the content')
+                if len(text) > rewind:
+                    diffs.append((op, text[:-rewind]))
+                rewind -= len(text)
+            patch_diffs[0] = (patch_diffs[0][0], patch_diffs[0][1][min(overlap, lead):])
+        diffs.extend(patch_diffs)
+        position += len(diff_maker.diff_text1(patch_diffs))
+        produced = start + len(new_text)
+        produced_utf16 = start_utf16 + _utf16_length(new_text)
+    diffs.append((diff_maker.DIFF_EQUAL, content[position:]))
+    return make_delta([(op, text) for op, text in diffs if text])
+
+
+def apply_change(content, data):
+    """
+    Apply the data of a change to the content it was made on
+
+    Changes are stored as diff-match-patch deltas, which only hold the length of equal and deleted runs and the
+    inserted text. Changes made before that are lists of (operation, text) pairs and are still replayed as patches.
+    """
+    if isinstance(data, str):
+        return apply_delta(content, data)
+    patches = diff_maker.patch_make(content, data)
+    content, _ = diff_maker.patch_apply(patches, content)
+    return content
+
+
+def latest_checkpoint(category_id, page_id, until=None):
+    query = Checkpoint.query.filter(*_page_filter(Checkpoint, category_id, page_id))
+    if until is not None:
+        query = query.filter(Checkpoint.created_at <= until)
+    return query.order_by(Checkpoint.created_at.desc()).first()
+
+
+def page_changes(category_id, page_id):
+    return Change.query.filter(*_page_filter(Change, category_id, page_id)).order_by(Change.created_at)
+
+
+def changes_since(category_id, page_id, checkpoint=None):
+    query = page_changes(category_id, page_id)
+    if checkpoint:
+        query = query.filter(Change.created_at > checkpoint.created_at)
+    return query
+
+
+def replay(content, changes):
+    for change in changes:
+        content = apply_change(content, change.data)
+        yield content
+
+
+def render_content(category_id, page_id):
+    """
+    Rebuild the content of a page starting at its newest checkpoint and replaying only the changes made after it
+    """
+    checkpoint = latest_checkpoint(category_id, page_id)
+    content = checkpoint.content if checkpoint else ''
+    for content in replay(content, changes_since(category_id, page_id, checkpoint)):
+        pass
+    return content
+
+
+def should_checkpoint(category_id, page_id):
+    config = current_app.config
+    interval = config.get('CONTENT_CHECKPOINT_INTERVAL', 50)
+    size = config.get('CONTENT_CHECKPOINT_SIZE', 256 * 1024)
+    checkpoint = latest_checkpoint(category_id, page_id)
+    query = db.session.query(db.func.count(), db.func.sum(db.func.length(db.cast(Change.data, db.Text))))
+    query = query.filter(*_page_filter(Change, category_id, page_id))
+    if checkpoint:
+        query = query.filter(Change.created_at > checkpoint.created_at)
+    count, total = query.one()
+    return count + 1 >= interval or (total or 0) >= size
+
+
+def add_change(session, page, data, content):
+    """
+    Add a change to the page and store a checkpoint with the full resulting content when one is due
+
+    :param content: The content of the page after the change has been applied
+    """
+    change = Change(category=page.category, page=page.id, data=data)
+    if should_checkpoint(page.category, page.id):
+        change.checkpoint = Checkpoint(content=content)
+    session.add(change)
+    page.bump_version()
+    return change
+
+
+def compact_history(page, cutoff, batch_size=500):
+    """
+    Squash all changes of the page made before cutoff into a single baseline change holding their combined content
+
+    The changes are replayed in batches of batch_size and removed with bulk deletes, so the memory used does not
+    depend on the length of the history. Returns the number of changes that were removed.
+    """
+    old_changes = changes_since(page.category, page.id).filter(Change.created_at < cutoff)
+    count = old_changes.count()
+    if count < 2:
+        return 0
+    created_at, author = old_changes.with_entities(Change.created_at, Change.author).offset(count - 1).first()
+    checkpoint = latest_checkpoint(page.category, page.id, until=created_at)
+    content = checkpoint.content if checkpoint else ''
+    replayed = changes_since(page.category, page.id, checkpoint).filter(Change.created_at <= created_at)
+    for content in replay(content, replayed.with_entities(Change.data).yield_per(batch_size)):
+        pass
+    if checkpoint:
+        db.session.expunge(checkpoint)
+
+    Checkpoint.query \
+        .filter(*_page_filter(Checkpoint, page.category, page.id), Checkpoint.created_at <= created_at) \
+        .delete(synchronize_session=False)
+    Change.query \
+        .filter(*_page_filter(Change, page.category, page.id), Change.created_at <= created_at) \
+        .delete(synchronize_session=False)
+    baseline = Change(category=page.category, page=page.id, created_at=created_at, author=author,
+                      data=make_delta([(diff_maker.DIFF_INSERT, content)]))
+    baseline.checkpoint = Checkpoint(content=content)
+    db.session.add(baseline)
+    page.bump_version()
+    return count - 1
+
+
+def cache_content(page):
+    return rendered(render_content(page.category, page.id))
+
+
+def validate_cache(key, content, cache_version, page_version=None):
+    if page_version is None or not isinstance(content, RenderedContent):
+        return False
+    return page_version == cache_version
+
+
+content_cache = CacheDict(cache_content, validate_cache, name='content')
+
+
+page_requests = Counter()
+_page_requests_lock = Lock()
+
+
+def _cached_content(page) -> RenderedContent:
+    return content_cache.get_or_compute((page.category, page.id), page, version=page.version,
+                                        validate={'page_version': page.version}).value
+
+
+def get_content(page) -> RenderedContent:
+    """
+    Get the rendered content of the page from the cache, rendering it first if the cached version is outdated
+
+    Concurrent requests for an outdated page wait for a single render instead of each replaying the history.
+    """
+    with _page_requests_lock:
+        page_requests[(page.category, page.id)] += 1
+    return _cached_content(page)
+
+
+# the page versions this worker read from the database for the cached content, with the generation of the bus
+_trusted = {}
+_evictions = 0
+_evictions_lock = Lock()
+_written_key = 'written_content'
+
+
+def read_content(category_id, page_id) -> RenderedContent:
+    """
+    Get the rendered content of the page (category_id, page_id) without reading the page when it can be trusted
+
+    Once this worker has checked the cached content against the version of the page, it is served without reading
+    the page again until the invalidation bus delivers a write to it. While the bus is not listening every read
+    checks the version.
+    """
+    key = (category_id, page_id)
+    generation = bus.generation
+    trusted = _trusted.get(key)
+    if trusted is not None and generation is not None and trusted[1] == generation:
+        # a newer version stored by a write of this worker, or one on the node, is not the one that was checked
+        content = content_cache.lookup(key, page_version=trusted[0])
+        if content is not None:
+            with _page_requests_lock:
+                page_requests[key] += 1
+            return content
+    evictions = _evictions
+    page = Page.query.get_or_404(key)
+    content = get_content(page)
+    # an eviction while the page was read may have been for a write the read did not see yet
+    if generation is not None and evictions == _evictions:
+        _trusted[key] = page.version, generation
+    return content
+
+
+def _snapshot_path(path=None):
+    return path or current_app.config.get('CACHE_SNAPSHOT_PATH') or \
+        os.path.join(current_app.instance_path, 'content.snapshot')
+
+
+def _read_snapshot(path):
+    try:
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return {}
+
+
+@contextmanager
+def _snapshot_lock(path):
+    if fcntl is None:
+        yield
+        return
+    with open(f'{path}.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def save_snapshot(path=None):
+    """
+    Write the cached content of the pages and how often each page was requested to the snapshot file
+
+    The request counts are added to the ones already in the snapshot, so it keeps track of the pages requested
+    most over all workers and restarts. The file is locked while it is merged, workers exiting together would
+    otherwise replace each other's counts. Returns the number of pages in the snapshot.
+    """
+    path = _snapshot_path(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with _page_requests_lock:
+        requests = page_requests.copy()
+        page_requests.clear()
+    with _snapshot_lock(path):
+        snapshot = _read_snapshot(path)
+        for key in content_cache:
+            entry = content_cache.backend.get(key)
+            if entry is not None:
+                snapshot.setdefault(key, {'requests': 0}).update(content=entry[0], version=entry[1])
+        for key, count in requests.items():
+            snapshot.setdefault(key, {'requests': 0, 'content': None, 'version': None})['requests'] += count
+        with open(f'{path}.{os.getpid()}', 'wb') as file:
+            pickle.dump(snapshot, file)
+        os.replace(f'{path}.{os.getpid()}', path)
+    return len(snapshot)
+
+
+def load_snapshot(path=None, snapshot=None):
+    """
+    Fill the content cache from the snapshot file, skipping every page that changed since the snapshot was taken
+
+    Returns the number of pages that were loaded.
+    """
+    snapshot = _read_snapshot(_snapshot_path(path)) if snapshot is None else snapshot
+    versions = {(category, page): version for category, page, version in
+                db.session.query(Page.category, Page.id, Page.version)}
+    loaded = 0
+    for key, entry in snapshot.items():
+        content, version = entry.get('content'), entry.get('version')
+        if content is None or versions.get(key) != version:
+            continue
+        if content_cache.lookup(key, page_version=version) is None:
+            content_cache.store(key, content, version=version)
+            loaded += 1
+    return loaded
+
+
+def warm_content(limit=None, path=None):
+    """
+    Load the snapshot into the content cache and render the limit most requested pages, or all pages without limit
+
+    Returns the number of pages that were loaded from the snapshot and the number of pages that were rendered.
+    """
+    snapshot = _read_snapshot(_snapshot_path(path))
+    loaded = load_snapshot(snapshot=snapshot)
+    pages = Page.query.all()
+    pages.sort(key=lambda page: snapshot.get((page.category, page.id), {}).get('requests', 0), reverse=True)
+    rendered_pages = 0
+    for page in pages[:limit]:
+        if content_cache.lookup((page.category, page.id), page_version=page.version) is None:
+            _cached_content(page)
+            rendered_pages += 1
+    return loaded, rendered_pages
+
+
+revision_cache = CacheDict(None, validate_cache, name='revision')
+
+
+def _forget(key):
+    global _evictions
+    with _evictions_lock:
+        _evictions += 1
+        _trusted.pop(key, None)
+
+
+def evict_content(key, shared=False):
+    """
+    Drop the cached content and revisions of the page (category_id, page_id) from the caches of this worker, or
+    with shared from the caches shared by the node
+
+    The shared caches are only evicted for writes on other nodes, a worker of this node already stored the new
+    content there and the version checks reject the old one.
+    """
+    key = tuple(key[:2])
+    _forget(key)
+    if content_cache.backend.shared == shared:
+        content_cache.invalidate(key)
+    if revision_cache.backend.shared == shared:
+        for revision_key in list(revision_cache):
+            if tuple(revision_key[:2]) == key:
+                revision_cache.invalidate(revision_key)
+
+
+def content_written(session, category_id, page_id):
+    """
+    Publish a write to the content of the page (category_id, page_id) made in the transaction of session
+
+    The other workers evict the page when the write is committed, this worker stops trusting its cached content
+    once the transaction ends.
+    """
+    bus.publish('content', (category_id, page_id), session=session)
+    session.info.setdefault(_written_key, set()).add((category_id, page_id))
+
+
+def _after_transaction_end(session, transaction):
+    # as with the response cache, releasing the outermost savepoint commits on sqlite
+    if transaction.parent is None:
+        written = session.info.pop(_written_key, ())
+    elif transaction.nested and transaction.parent.parent is None:
+        written = session.info.get(_written_key, ())
+    else:
+        return
+    for key in written:
+        _forget(key)
+
+
+event.listen(Session, 'after_transaction_end', _after_transaction_end)
+
+# the content is only written with its changes, the other writes to a page leave it as it is
+for _topic in ('content', Change.__tablename__):
+    bus.subscribe(_topic, evict_content)
+    bus.subscribe(_topic, partial(evict_content, shared=True), node=True)
+
+
+def revision_at(category_id, page_id, timestamp):
+    if timestamp.tzinfo is not None:
+        # created_at is stored as naive UTC
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return page_changes(category_id, page_id).filter(Change.created_at <= timestamp).count()
+
+
+def render_revision(page, revision) -> RenderedContent:
+    """
+    Rebuild the content of the page as it was after its first `revision` changes
+
+    The replay starts at the closest cached revision or checkpoint before the requested one and every state passed
+    on the way is cached, so stepping through adjacent revisions only replays a few changes each.
+    """
+    changes = page_changes(page.category, page.id)
+    total = changes.count()
+    if revision > total:
+        abort(404)
+    if revision == total:
+        return get_content(page)
+    if revision == 0:
+        return rendered('')
+
+    target = changes.offset(revision - 1).first()
+    checkpoint = latest_checkpoint(page.category, page.id, until=target.created_at)
+    start, content = 0, ''
+    if checkpoint:
+        start = changes.filter(Change.created_at <= checkpoint.created_at).count()
+        content = checkpoint.content
+    for index in range(revision, start, -1):
+        cached = revision_cache.lookup((page.category, page.id, index), page_version=page.version)
+        if cached:
+            start, content = index, cached.text
+            if index == revision:
+                return cached
+            break
+
+    state = rendered(content)
+    for index, content in enumerate(replay(content, changes.offset(start).limit(revision - start)), start + 1):
+        state = rendered(content)
+        revision_cache.store((page.category, page.id, index), state, version=page.version)
+    return state
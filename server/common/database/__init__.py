@@ -1,14 +1,41 @@
+from sqlalchemy.schema import CreateColumn
+
 from server.common.database.category import Category
 from server.common.database.change import Change
+from server.common.database.checkpoint import Checkpoint
 from server.common.database.event import Event
 from server.common.database.gallery import Gallery
+from server.common.database.invalidation import Invalidation
 from server.common.database.media import Media
+from server.common.database.media_job import MediaJob
 from server.common.database.page import Page
 from server.common.database.ref import db
 from server.common.database.user import User
 
-__all__ = ['db', 'User', 'Category', 'Page', 'Change', 'Media', 'Gallery', 'Event', 'setup']
+__all__ = ['db', 'User', 'Category', 'Page', 'Change', 'Checkpoint', 'Media', 'Gallery', 'Event', 'Invalidation',
+           'MediaJob', 'setup']
+
+
+def add_missing_columns(engine):
+    """
+    Add columns that were introduced after a table has been created, create_all only creates missing tables
+    """
+    inspector = db.inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                raise RuntimeError(f'Cannot add column {table.name}.{column.name} without a server default')
+            ddl = CreateColumn(column).compile(dialect=engine.dialect)
+            engine.execute(f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}')
 
 
 def setup(app):
     db.create_all(app=app)
+    add_missing_columns(db.get_engine(app))
@@ -13,3 +13,4 @@ class Change(db.Model):
     data = db.Column(db.JSON, nullable=False)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp(), primary_key=True)
     author = db.Column(UUIDType, db.ForeignKey('user.id'), default=lambda: get_current_user().id, nullable=False)
+    checkpoint = db.relationship('Checkpoint', uselist=False, cascade='all, delete-orphan')
@@ -0,0 +1,13 @@
+from server.common.database.ref import db
+
+
+class Checkpoint(db.Model):
+    __tablename__ = 'checkpoint'
+    __table_args__ = (db.ForeignKeyConstraint(('category', 'page', 'created_at'),
+                                              ('change.category', 'change.page', 'change.created_at'),
+                                              ondelete='CASCADE'),)
+
+    category = db.Column(db.String(20), nullable=False, primary_key=True)
+    page = db.Column(db.String(20), nullable=False, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, primary_key=True)
+    content = db.Column(db.Text, nullable=False)
@@ -0,0 +1,11 @@
+from server.common.database.ref import db
+
+
+class Invalidation(db.Model):
+    __tablename__ = 'invalidation'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    topic = db.Column(db.String(63), nullable=False)
+    key = db.Column(db.JSON, nullable=False)
+    origin = db.Column(db.String(63), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp(), index=True)
@@ -2,6 +2,7 @@ from flask_jwt_extended import get_current_user
 
 from server.common.database.mixins import UUIDKeyMixin, UUIDType
 from server.common.database.ref import db
+from server.common.util.enums import MediaStatus
 
 
 class Media(UUIDKeyMixin, db.Model):
@@ -12,6 +13,9 @@ class Media(UUIDKeyMixin, db.Model):
     extension = db.Column(db.String(15), nullable=False)
     owner_id = db.Column(UUIDType, db.ForeignKey('user.id'), default=lambda: get_current_user().id, nullable=False)
     owner = db.relationship('User')
+    status = db.Column(db.Enum(MediaStatus, native_enum=False), nullable=False, default=MediaStatus.ready,
+                       server_default=MediaStatus.ready.name)
+    jobs = db.relationship('MediaJob', backref='media', cascade='all, delete-orphan')
 
     def get_file_name(self, suffix=''):
         return f'{str(self.id)}{suffix}.{self.extension}'
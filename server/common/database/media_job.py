@@ -0,0 +1,16 @@
+from server.common.database.mixins import UUIDType
+from server.common.database.ref import db
+from server.common.util.enums import JobStatus
+
+
+class MediaJob(db.Model):
+    __tablename__ = 'media_job'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    media_id = db.Column(UUIDType, db.ForeignKey('media.id', ondelete='CASCADE'), nullable=False, index=True)
+    status = db.Column(db.Enum(JobStatus, native_enum=False), nullable=False, default=JobStatus.pending, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(63))
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+    started_at = db.Column(db.DateTime)
@@ -1,3 +1,4 @@
+from server.common.database.change import Change
 from server.common.database.ref import db
 
 
@@ -8,10 +9,14 @@ class Page(db.Model):
     id = db.Column(db.String(20), nullable=False, primary_key=True)
     order = db.Column(db.Integer, nullable=False)
     title = db.Column(db.String(63), nullable=False)
-    content = db.relationship("Change")
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    content = db.relationship("Change", order_by=Change.created_at)
 
     @property
     def last_update(self):
-        if not self.content:
-            return None
-        return self.content[-1].created_at
+        return db.session.query(db.func.max(Change.created_at)) \
+            .filter(Change.category == self.category, Change.page == self.id) \
+            .scalar()
+
+    def bump_version(self):
+        self.version = Page.version + 1
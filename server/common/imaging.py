@@ -0,0 +1,96 @@
+import os
+import shutil
+
+from PIL import Image, ImageOps
+
+__all__ = ['FITS', 'kept_exif', 'readable', 'resize', 'render', 'save', 'supports']
+
+FITS = ('cover', 'contain')
+
+# the copyright is the only metadata kept, like the tinify compressor does, the rest may hold the location
+_KEPT_EXIF_TAGS = (0x8298,)
+
+_SAVE_OPTIONS = {
+    'JPEG': {'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'method': 6},
+    'AVIF': {'speed': 6},
+}
+
+
+def supports(extension):
+    """
+    Check whether the installed Pillow can write images with the file extension, AVIF depends on its version
+    """
+    image_format = Image.registered_extensions().get(f'.{extension.lower()}')
+    return image_format is not None and image_format in Image.SAVE
+
+
+def readable(extension):
+    """
+    Check whether the installed Pillow can open images with the file extension, vector images like SVG can not
+    """
+    image_format = Image.registered_extensions().get(f'.{extension.lower()}')
+    return image_format is not None and image_format in Image.OPEN
+
+
+def resize(image: Image.Image, width=None, height=None, fit='contain'):
+    """
+    Scale image to the box of width and height, a missing side is computed from the aspect ratio
+
+    With fit cover the image fills the whole box and is cropped around its center, with contain it fits into the
+    box. Images are never scaled up to fit into a box.
+    """
+    if width is None and height is None:
+        return image
+    if width is None or height is None:
+        ratio = (width / image.width) if height is None else (height / image.height)
+        width, height = width or round(image.width * ratio), height or round(image.height * ratio)
+        fit = 'contain'
+    if fit == 'cover':
+        return ImageOps.fit(image, (max(width, 1), max(height, 1)), Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail((max(width, 1), max(height, 1)), Image.LANCZOS)
+    return image
+
+
+def render(source, target, size=None, quality=85):
+    """
+    Write the image in source to target in the format of its extension, optimized and scaled to size
+
+    :param size: None for the full image or a tuple of width, height and fit
+    """
+    with Image.open(source) as image:
+        if size is None and getattr(image, 'is_animated', False) and \
+                os.path.splitext(source)[1].lower() == os.path.splitext(target)[1].lower():
+            # only the first frame would be kept
+            shutil.copyfile(source, target)
+            return
+        exif = kept_exif(image)
+        image = ImageOps.exif_transpose(image)
+        if size is not None:
+            image = resize(image, *size)
+        save(image, target, quality, exif=exif)
+
+
+def kept_exif(image: Image.Image):
+    """
+    Get the EXIF tags of image that are written to the files rendered from it
+    """
+    exif, kept = image.getexif(), Image.Exif()
+    for tag in _KEPT_EXIF_TAGS:
+        if tag in exif:
+            kept[tag] = exif[tag]
+    return kept
+
+
+def save(image: Image.Image, target, quality=85, image_format=None, exif=None):
+    image_format = image_format or Image.registered_extensions().get(os.path.splitext(target)[1].lower())
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    options = _SAVE_OPTIONS.get(image_format, {})
+    if image_format in ('JPEG', 'WEBP', 'AVIF'):
+        options = {**options, 'quality': quality}
+    if exif and image_format in ('JPEG', 'PNG', 'WEBP', 'AVIF'):
+        options = {**options, 'exif': exif.tobytes()}
+    image.save(target, image_format, **options)
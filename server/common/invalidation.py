@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import select
+import socket
+import time
+from datetime import datetime, timedelta
+from threading import Thread, Lock
+
+from flask import Flask
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from server.common.database import db, Invalidation
+
+__all__ = ['InvalidationBus', 'bus']
+
+_logger = logging.getLogger(__name__)
+
+
+class InvalidationBus:
+    """
+    Tells the workers of every node which cached entries were changed by a write
+
+    Messages are sent within the transaction of the write, so they only reach the other workers once it is committed.
+    On Postgres they are sent with NOTIFY, other databases get them through the invalidation table, which every
+    worker polls. A worker does not receive the messages it sent itself.
+
+    The generation counts the connections of the listener of this worker, entries that were checked against the
+    database in an earlier generation may have missed a message while it was disconnected.
+    """
+    channel = 'cache_invalidation'
+
+    def __init__(self):
+        self.transport = None
+        self._subscribers = {}
+        self._lock = Lock()
+        self._thread = None
+        self._pid = None
+        self._generation = None
+
+    def init_app(self, app: Flask):
+        self.transport = app.config.get('INVALIDATION_BACKEND', 'auto')
+        if self.transport == 'auto':
+            uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
+            self.transport = 'postgres' if uri.startswith(('postgres', 'postgresql')) else 'polling'
+        if self.transport not in ('postgres', 'polling', None):
+            raise ValueError(f'Unknown invalidation backend {self.transport}')
+        if self.transport is None:
+            return
+        app.before_first_request(lambda: self.listen(app))
+        if not event.contains(Session, 'after_flush', self._after_flush):
+            event.listen(Session, 'after_flush', self._after_flush)
+
+    @property
+    def topics(self):
+        return set(self._subscribers)
+
+    @property
+    def generation(self):
+        """
+        The number of the current connection of the listener of this worker, None while it is not listening
+        """
+        generation = self._generation
+        if generation is None or generation[0] != os.getpid() or not self._thread.is_alive():
+            return None
+        return generation[1]
+
+    def _connected(self):
+        generation = self._generation
+        self._generation = os.getpid(), (generation[1] + 1 if generation else 1)
+
+    def subscribe(self, topic, callback, node=False):
+        """
+        Call callback(key) whenever another worker publishes key under topic
+
+        Every write to a model is published under the name of its table with its primary key.
+
+        :param node: Only call callback for the workers of other nodes, for state that is shared by the node
+        """
+        self._subscribers.setdefault(topic, []).append((callback, node))
+
+    def publish(self, topic, key, session=None):
+        """
+        Publish that the entries stored for key under topic are outdated once the current transaction is committed
+        """
+        self._send(session or db.session, [(topic, key)])
+
+    def _send(self, session, messages):
+        if self.transport is None or not messages:
+            return
+        connection = session.connection()
+        origin = self._origin()
+        if self.transport == 'postgres':
+            for topic, key in messages:
+                payload = json.dumps({'topic': topic, 'key': key, 'origin': origin}, default=str)
+                connection.execute(db.select([db.func.pg_notify(self.channel, payload)]))
+        else:
+            connection.execute(Invalidation.__table__.insert(), [
+                {'topic': topic, 'key': json.loads(json.dumps(key, default=str)), 'origin': origin,
+                 'created_at': datetime.utcnow()}
+                for topic, key in messages
+            ])
+
+    def _after_flush(self, session, flush_context):
+        topics = self.topics
+        messages = []
+        for instance in (*session.new, *session.dirty, *session.deleted):
+            table = getattr(instance, '__tablename__', None)
+            if table not in topics or table == Invalidation.__tablename__:
+                continue
+            key = inspect(instance).mapper.primary_key_from_instance(instance)
+            messages.append((table, key[0] if len(key) == 1 else key))
+        self._send(session, messages)
+
+    def _origin(self):
+        # workers on the same node have their own caches, so every process is an origin of its own
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def deliver(self, topic, key, origin=None):
+        if origin == self._origin():
+            return
+        if isinstance(key, list):
+            key = tuple(key)
+        same_node = origin is not None and origin.rsplit(':', 1)[0] == socket.gethostname()
+        for callback, node in self._subscribers.get(topic, ()):
+            if node and same_node:
+                continue
+            try:
+                callback(key)
+            except Exception:
+                _logger.exception('Invalidation of %s %s failed', topic, key)
+
+    def listen(self, app: Flask):
+        """
+        Start receiving the messages of the other workers in a background thread of this process
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            target = self._listen_postgres if self.transport == 'postgres' else self._poll
+            self._thread = Thread(target=target, args=(app,), name='invalidation-bus', daemon=True)
+            self._thread.start()
+
+    def _listen_postgres(self, app: Flask):
+        while True:
+            try:
+                connection = db.get_engine(app).raw_connection()
+                try:
+                    connection.connection.set_isolation_level(0)
+                    cursor = connection.cursor()
+                    cursor.execute(f'LISTEN {self.channel}')
+                    self._connected()
+                    while True:
+                        if select.select([connection.connection], [], [], 60) == ([], [], []):
+                            continue
+                        connection.connection.poll()
+                        while connection.connection.notifies:
+                            message = json.loads(connection.connection.notifies.pop(0).payload)
+                            self.deliver(message['topic'], message['key'], message['origin'])
+                finally:
+                    connection.close()
+            except Exception:
+                # the messages sent until the next LISTEN are lost
+                self._generation = None
+                _logger.exception('Lost the connection listening for invalidations')
+                time.sleep(app.config.get('INVALIDATION_POLL_INTERVAL', 1.0))
+
+    def _poll(self, app: Flask):
+        table = Invalidation.__table__
+        interval = app.config.get('INVALIDATION_POLL_INTERVAL', 1.0)
+        retention = timedelta(seconds=app.config.get('INVALIDATION_RETENTION', 3600))
+        last, cleaned = None, time.monotonic()
+        while True:
+            try:
+                with db.get_engine(app).begin() as connection:
+                    if last is None:
+                        last = connection.execute(db.select([db.func.coalesce(db.func.max(table.c.id), 0)])).scalar()
+                        self._connected()
+                    rows = connection.execute(table.select().where(table.c.id > last).order_by(table.c.id)).fetchall()
+                    if time.monotonic() - cleaned > retention.total_seconds():
+                        connection.execute(table.delete().where(table.c.created_at < datetime.utcnow() - retention))
+                        cleaned = time.monotonic()
+                for row in rows:
+                    last = row.id
+                    self.deliver(row.topic, row.key, row.origin)
+            except Exception:
+                _logger.exception('Polling for invalidations failed')
+            time.sleep(interval)
+
+
+bus = InvalidationBus()
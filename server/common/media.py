@@ -0,0 +1,466 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+
+from flask import Flask, after_this_request, current_app, has_request_context
+from werkzeug.utils import import_string
+
+from server.common.database import db, Media, MediaJob
+from server.common.imaging import FITS, readable, render, supports
+from server.common.tinify import tinify
+from server.common.util.enums import JobStatus, MediaStatus
+from server.common.util.file import get_save_path
+
+__all__ = ['MediaProcessor', 'LocalCompressor', 'PillowCompressor', 'TinifyCompressor', 'DerivedFileCache',
+           'media_processor', 'derived_cache']
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows, the variants are only locked within the process
+    fcntl = None
+
+_logger = logging.getLogger(__name__)
+
+
+def _partial(target, job_id):
+    # keeps the extension, compressors pick the format of the output by it
+    root, ext = os.path.splitext(target)
+    return f'{root}.{job_id}.part{ext}'
+
+
+class LocalCompressor:
+    """
+    Stand-in for the remote compressor that copies the original to every variant, for development and tests
+    """
+
+    def process(self, source, variants):
+        for target, size in variants:
+            shutil.copyfile(source, target)
+
+
+class PillowCompressor:
+    """
+    Optimizes the original and renders the resized variants with Pillow in a pool of processes
+
+    The pool is started by the first job of a worker process, so the image work neither runs on a request thread
+    nor holds the interpreter lock of the worker. Every worker has its own pool and every process of it imports the
+    app, so MEDIA_PROCESSES is kept small.
+    """
+
+    def __init__(self):
+        self.processes = 1
+        self.quality = 85
+        self._pool = None
+        self._pid = None
+        self._lock = Lock()
+
+    def init_app(self, app: Flask):
+        self.processes = app.config.get('MEDIA_PROCESSES', 1)
+        self.quality = app.config.get('MEDIA_QUALITY', 85)
+
+    @property
+    def pool(self):
+        with self._lock:
+            # a pool inherited from the parent of a forked worker can not be used
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            return self._pool
+
+    def process(self, source, variants):
+        futures = [self.pool.submit(render, source, target, size, self.quality) for target, size in variants]
+        for future in futures:
+            future.result()
+
+
+class TinifyCompressor(PillowCompressor):
+    """
+    Compresses the original with the TinyPNG API and renders the resized variants from the result with Pillow
+
+    Every resize is billed by the API as another compression, so only the full image is sent to it.
+    """
+
+    def process(self, source, variants):
+        full = [target for target, size in variants if size is None]
+        if full:
+            compressed = tinify.from_file(source).preserve('copyright').to_buffer()
+            for target in full:
+                with open(target, 'wb') as file:
+                    file.write(compressed)
+            source = full[0]
+        super().process(source, [(target, size) for target, size in variants if size is not None])
+
+
+class MediaProcessor:
+    """
+    Optimizes uploaded images and renders their resized variants in a pool of background threads
+
+    An upload only stores the original file and queues a job in the media_job table, so pending work survives a
+    restart. Every worker process claims pending jobs from the table for its own pool, a job that was claimed by a
+    worker that died is handed out again once MEDIA_JOB_TIMEOUT has passed.
+    """
+    compressors = {'local': LocalCompressor, 'pillow': PillowCompressor, 'tinify': TinifyCompressor}
+    default_variants = {
+        'thumb': (150, 150, 'cover'),
+        'medium': (800, 800, 'contain'),
+        'large': (1600, 1600, 'contain')
+    }
+
+    def __init__(self):
+        self.compressor = None
+        self.workers = 0
+        self.variants = {'': None}
+        self._executor = None
+        self._running = set()
+        self._wake = Event()
+        self._lock = Lock()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app: Flask, compressor=None):
+        compressor = compressor or app.config.get('MEDIA_COMPRESSOR', 'auto')
+        if compressor == 'auto':
+            compressor = 'tinify' if app.config.get('TINIFY_KEY') else 'pillow'
+        if isinstance(compressor, str):
+            compressor = self.compressors.get(compressor) or import_string(compressor)
+        self.compressor = compressor() if isinstance(compressor, type) else compressor
+        if hasattr(self.compressor, 'init_app'):
+            self.compressor.init_app(app)
+        self.workers = app.config.get('MEDIA_WORKERS', 2)
+        self.variants = {'': None}
+        for name, (width, height, fit) in app.config.get('MEDIA_VARIANTS', self.default_variants).items():
+            if fit not in FITS:
+                raise ValueError(f'Unknown fit {fit} of the media variant {name}')
+            self.variants[f'_{name}'] = (width, height, fit)
+        app.extensions['media_processor'] = self
+        if self.workers:
+            app.before_first_request(lambda: self.start(app))
+
+    def enqueue(self, media: Media, session=None):
+        """
+        Queue the processing of the original file of media, the workers are woken once the request is done
+        """
+        media.status = MediaStatus.processing
+        (session or db.session).add(MediaJob(media_id=media.id))
+        if has_request_context():
+            after_this_request(self._after_request)
+
+    def _after_request(self, response):
+        self._wake.set()
+        return response
+
+    def variant_suffix(self, name):
+        """
+        Get the suffix of the file name of the variant called name, KeyError if there is no such variant
+        """
+        suffix = f'_{name}'
+        if not name or suffix not in self.variants:
+            raise KeyError(name)
+        return suffix
+
+    def file_names(self, media: Media):
+        return [media.get_file_name(suffix) for suffix in (*self.variants, '_original')]
+
+    def start(self, app: Flask):
+        """
+        Start claiming pending jobs for the pool of this process in a background thread
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._running = set()
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='media')
+            self._thread = Thread(target=self._dispatch, args=(app,), name='media-dispatcher', daemon=True)
+            self._thread.start()
+
+    def _dispatch(self, app: Flask):
+        interval = app.config.get('MEDIA_POLL_INTERVAL', 5.0)
+        while True:
+            try:
+                with app.app_context():
+                    self.release_stale()
+                    for job_id in self.claim(self.workers - len(self._running)):
+                        self._running.add(job_id)
+                        future = self._executor.submit(self._run, app, job_id)
+                        future.add_done_callback(lambda _, job_id=job_id: self._done(job_id))
+            except Exception:
+                _logger.exception('Dispatching media jobs failed')
+            self._wake.wait(interval)
+            self._wake.clear()
+
+    def _run(self, app: Flask, job_id):
+        with app.app_context():
+            self.process(job_id)
+
+    def _done(self, job_id):
+        self._running.discard(job_id)
+        self._wake.set()
+
+    @staticmethod
+    def _origin():
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def claim(self, limit):
+        """
+        Mark up to limit pending jobs as running on this worker and get their ids
+        """
+        if limit <= 0:
+            return []
+        table = MediaJob.__table__
+        # a job that failed is only tried again once MEDIA_RETRY_DELAY has passed since its last attempt
+        retry = datetime.utcnow() - timedelta(seconds=current_app.config.get('MEDIA_RETRY_DELAY', 60))
+        claimed = []
+        with db.engine.begin() as connection:
+            pending = connection.execute(db.select([table.c.id])
+                                         .where(db.and_(table.c.status == JobStatus.pending,
+                                                        db.or_(table.c.started_at.is_(None),
+                                                               table.c.started_at < retry)))
+                                         .order_by(table.c.id).limit(limit)).fetchall()
+            for row in pending:
+                # another worker may have claimed the job since it was selected
+                result = connection.execute(table.update()
+                                            .where(db.and_(table.c.id == row.id, table.c.status == JobStatus.pending))
+                                            .values(status=JobStatus.running, worker=self._origin(),
+                                                    started_at=datetime.utcnow(), attempts=table.c.attempts + 1))
+                if result.rowcount:
+                    claimed.append(row.id)
+        return claimed
+
+    def release_stale(self):
+        table = MediaJob.__table__
+        timeout = timedelta(seconds=current_app.config.get('MEDIA_JOB_TIMEOUT', 600))
+        stale = db.and_(table.c.status == JobStatus.running, table.c.started_at < datetime.utcnow() - timeout)
+        with db.engine.begin() as connection:
+            # checked first, an update takes the write lock of sqlite even if it matches no row
+            if connection.execute(db.select([table.c.id]).where(stale).limit(1)).first() is not None:
+                connection.execute(table.update().where(stale).values(status=JobStatus.pending))
+
+    def process(self, job_id):
+        """
+        Write the optimized file and the resized variants for the media of a claimed job
+        """
+        job = MediaJob.query.get(job_id)
+        if job is None:
+            return
+        media = job.media
+        if media is None:
+            db.session.delete(job)
+            db.session.commit()
+            return
+        save_path = get_save_path(media.mimetype.split('/')[0])
+        source = os.path.join(save_path, media.get_file_name('_original'))
+        if not os.path.exists(source):
+            # images stored before uploads were processed in the background only have the full file
+            source = os.path.join(save_path, media.get_file_name())
+        targets = {os.path.join(save_path, media.get_file_name(suffix)): size for suffix, size in self.variants.items()}
+        started = time.monotonic()
+        try:
+            # the variants are written next to their final name and only replace it once all of them are done
+            self.compressor.process(source, [(_partial(target, job.id), size) for target, size in targets.items()])
+            for target in targets:
+                os.replace(_partial(target, job.id), target)
+        except Exception as e:
+            _logger.exception('Processing media %s failed', media.id)
+            for target in targets:
+                if os.path.exists(_partial(target, job.id)):
+                    os.remove(_partial(target, job.id))
+            job.error = f'{type(e).__name__}: {e}'
+            if job.attempts < current_app.config.get('MEDIA_JOB_ATTEMPTS', 3):
+                job.status = JobStatus.pending
+            else:
+                job.status = JobStatus.failed
+                media.status = MediaStatus.failed
+        else:
+            _logger.info('Processed media %s in %.2fs', media.id, time.monotonic() - started)
+            db.session.delete(job)
+            media.status = MediaStatus.ready
+        db.session.commit()
+
+    def process_pending(self, limit=None):
+        """
+        Process pending jobs in the current thread until none are left or limit jobs are done
+        """
+        processed = 0
+        while limit is None or processed < limit:
+            claimed = self.claim(1)
+            if not claimed:
+                break
+            self.process(claimed[0])
+            processed += 1
+        return processed
+
+
+DEFAULT_RESIZE_SIZES = (64, 128, 256, 320, 480, 640, 768, 1024, 1280, 1600, 1920, 2560, 3840)
+
+
+class DerivedFileCache:
+    """
+    Keeps the images resized on request and the images converted to the formats negotiated with the Accept header
+    in the derived directory of FILE_STORE
+
+    Images are only resized to the widths and heights in MEDIA_RESIZE_SIZES, so the number of files one image can
+    produce stays small.
+
+    The directory is bounded by MEDIA_CACHE_MAX_BYTES, once it is exceeded the least recently served files are
+    removed. A variant is locked while it is rendered, in this process and with a file lock for the other workers
+    of the node, so concurrent first requests wait for a single rendering instead of doing it again.
+
+    Every worker counts the bytes it wrote since it last scanned the directory, the directory is only scanned again
+    once that estimate exceeds the limit.
+    """
+
+    def __init__(self):
+        self.max_bytes = None
+        self.sizes = ()
+        self.quality = 85
+        self.formats = []
+        self.format_quality = {}
+        self.mimetypes = []
+        self._bytes = None
+        self._guard = Lock()
+        self._locks = {}
+
+    def init_app(self, app: Flask):
+        self.max_bytes = app.config.get('MEDIA_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+        self.sizes = tuple(sorted(app.config.get('MEDIA_RESIZE_SIZES', DEFAULT_RESIZE_SIZES)))
+        self.quality = app.config.get('MEDIA_QUALITY', 85)
+        # in the order of preference, the formats the installed Pillow can not write are left out
+        self.formats = [extension for extension in app.config.get('MEDIA_NEGOTIATED_FORMATS', ('avif', 'webp'))
+                        if supports(extension)]
+        self.format_quality = app.config.get('MEDIA_FORMAT_QUALITY', {'avif': 60, 'webp': 80})
+        self.mimetypes = app.config.get('MEDIA_NEGOTIATED_TYPES', ('image/jpeg', 'image/png'))
+
+    @property
+    def path(self):
+        return get_save_path('derived')
+
+    @staticmethod
+    def resizable(media: Media):
+        return readable(media.extension)
+
+    def negotiable(self, media: Media):
+        return bool(self.formats) and media.mimetype in self.mimetypes and self.resizable(media)
+
+    def negotiate(self, media: Media, accept):
+        """
+        Get the extension of the preferred format the client accepts for media, None to keep the format of the upload
+
+        Only formats the client names are used, image/* and */* are also sent by browsers that can not show them.
+        """
+        if not self.negotiable(media):
+            return None
+        accepted = {value.lower() for value, quality in accept if quality > 0}
+        return next((extension for extension in self.formats if f'image/{extension}' in accepted), None)
+
+    def file_name(self, media: Media, source, width=None, height=None, fit='contain', extension=None):
+        extension = extension or media.extension
+        if width is None and height is None:
+            return f'{os.path.splitext(os.path.basename(source))[0]}.{extension}'
+        return f'{media.id}_{width or ""}x{height or ""}_{fit}.{extension}'
+
+    def get(self, media: Media, source, width=None, height=None, fit='contain', extension=None):
+        """
+        Get the path of source scaled to width and height and converted to the format of extension,
+        rendering it if it is not in the cache yet
+        """
+        path = os.path.join(self.path, self.file_name(media, source, width, height, fit, extension))
+        size = None if width is None and height is None else (width, height, fit)
+        if self._touch(path):
+            return path
+        with self._locked(path):
+            # another thread or worker may have rendered it while this one waited for the lock
+            if self._touch(path):
+                return path
+            # hidden until it is complete, eviction leaves the files starting with a dot alone
+            partial = os.path.join(self.path, f'.{os.getpid()}.{os.path.basename(path)}')
+            render(source, partial, size, self.format_quality.get(extension, self.quality))
+            written = os.path.getsize(partial)
+            os.replace(partial, path)
+        self._written(written)
+        return path
+
+    def evict(self, media: Media):
+        """
+        Remove the resized and converted files of media
+        """
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.name.startswith((f'{media.id}_', f'{media.id}.', f'.{media.id}_', f'.{media.id}.')):
+                    self._remove(entry.path)
+
+    @staticmethod
+    def _touch(path):
+        # the modification time is the last use, eviction removes the files with the oldest first
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def _locked(self, path):
+        with self._guard:
+            lock = self._locks.setdefault(path, [Lock(), 0])
+            lock[1] += 1
+        try:
+            with lock[0]:
+                if fcntl is None:
+                    yield
+                    return
+                directory, name = os.path.split(path)
+                with open(os.path.join(directory, f'.{name}.lock'), 'w') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        yield
+                    finally:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            with self._guard:
+                lock[1] -= 1
+                if not lock[1]:
+                    self._locks.pop(path, None)
+
+    def _written(self, size):
+        with self._guard:
+            if self._bytes is not None:
+                self._bytes += size
+            if self.max_bytes is None or (self._bytes is not None and self._bytes <= self.max_bytes):
+                return
+        self._bytes = self._evict()
+
+    def _evict(self):
+        files = []
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if not entry.name.startswith('.') and entry.is_file():
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        # down to 90% of the limit, so the next few files do not trigger another scan right away
+        target = self.max_bytes * 0.9
+        for mtime, size, path in sorted(files):
+            if total <= target:
+                break
+            # the lock file is kept, another worker may hold it and would lose the lock if it was replaced
+            self._remove(path)
+            total -= size
+        return total
+
+
+media_processor = MediaProcessor()
+derived_cache = DerivedFileCache()
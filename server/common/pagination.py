@@ -0,0 +1,90 @@
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime
+
+from flask import current_app, request, url_for
+
+from server.common.database import db
+from server.common.util import RequestError
+
+__all__ = ['paginate']
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return value.hex
+    return value
+
+
+def _load_value(column, value):
+    python_type = column.type.python_type
+    if not isinstance(value, str if python_type in (datetime, uuid.UUID) else python_type):
+        raise TypeError(value)
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is uuid.UUID:
+        return uuid.UUID(value)
+    return value
+
+
+def encode_cursor(item, columns):
+    values = [_dump_value(getattr(item, column.name)) for column in columns]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf_8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(cursor)
+        return tuple(_load_value(column, value) for column, value in zip(columns, values))
+    except (ValueError, TypeError, binascii.Error):
+        raise RequestError('Invalid cursor')
+
+
+def _link(**args):
+    return url_for(request.endpoint, **request.view_args, **{**request.args.to_dict(), **args})
+
+
+def _links(columns, limit, last):
+    links = {'self': _link()}
+    if last is not None:
+        links['next'] = _link(cursor=encode_cursor(last, columns), limit=limit)
+    return links
+
+
+def paginate(query, columns, limit=None, cursor=None, stream=False):
+    """
+    Get a page of at most limit items of the query ordered by the unique key columns, starting after cursor
+
+    The items are looked up by their key instead of an offset, so every page takes the same time no matter how far
+    the client paged. The link to the next page holds the key of the last item as cursor.
+
+    :param stream: Return the items as a generator and the links as a function to call once it is exhausted,
+        for views marshalled with stream=True
+    """
+    config = current_app.config
+    limit = min(limit or config.get('PAGINATION_LIMIT', 50), config.get('PAGINATION_MAX_LIMIT', 500))
+    if cursor:
+        query = query.filter(db.tuple_(*columns) > decode_cursor(cursor, columns))
+    query = query.order_by(*columns).limit(limit + 1)
+    if not stream:
+        rows = query.all()
+        items = rows[:limit]
+        return {'items': items, '_links': _links(columns, limit, items[-1] if len(rows) > limit else None)}
+
+    state = {'last': None, 'more': False}
+
+    def items():
+        for index, item in enumerate(query.yield_per(config.get('STREAM_BATCH_SIZE', 100))):
+            if index == limit:
+                state['more'] = True
+                break
+            state['last'] = item
+            yield item
+
+    return {'items': items(), '_links': lambda: _links(columns, limit, state['last'] if state['more'] else None)}
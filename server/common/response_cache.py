@@ -0,0 +1,112 @@
+import time
+from functools import partial
+from threading import Lock
+
+import flask
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from server.common.database import db, Invalidation
+from server.common.invalidation import bus
+from server.common.util import CacheDict
+
+__all__ = ['ResponseCache', 'response_cache']
+
+
+class ResponseCache:
+    """
+    Keeps the serialized responses of anonymous GET requests to the views marked with cache_response
+
+    Every table has a version counter, which is bumped whenever a transaction that wrote to the table in this worker
+    ends or another worker publishes a write to it on the invalidation bus. A response is served from the cache as
+    long as the versions of the tables it was built from are unchanged.
+
+    The tables are not bumped when the rows are flushed, a request running before the commit would still read the
+    old rows and cache them under the new version.
+    """
+    info_key = 'response_cache_tables'
+
+    def __init__(self):
+        self.versions = {}
+        self._lock = Lock()
+        self.cache = CacheDict(None, self._validate, name='response')
+
+    def init_app(self, app: flask.Flask):
+        # the versions are counted per worker, so the responses can not be shared with other workers
+        self.cache.init_app(app, backend='memory')
+        app.extensions['response_cache'] = self
+        if not event.contains(Session, 'after_flush', self._after_flush):
+            event.listen(Session, 'after_flush', self._after_flush)
+            event.listen(Session, 'after_bulk_update', self._after_bulk)
+            event.listen(Session, 'after_bulk_delete', self._after_bulk)
+            event.listen(Session, 'after_transaction_end', self._after_transaction_end)
+            for table in db.metadata.tables:
+                if table != Invalidation.__tablename__:
+                    bus.subscribe(table, partial(self._bump_published, table))
+
+    def bump(self, *tables):
+        with self._lock:
+            for table in tables:
+                self.versions[table] = self.versions.get(table, 0) + 1
+
+    def _bump_published(self, table, key):
+        self.bump(table)
+
+    def _written(self, session, *tables):
+        session.info.setdefault(self.info_key, set()).update(tables)
+
+    def _after_flush(self, session, flush_context):
+        self._written(session, *{instance.__table__.name
+                                 for instance in (*session.new, *session.dirty, *session.deleted)})
+
+    def _after_bulk(self, context):
+        self._written(context.session, context.mapper.local_table.name)
+
+    def _after_transaction_end(self, session, transaction):
+        # releasing the outermost savepoint commits on sqlite, other databases only show the rows once the root
+        # transaction is committed, so the tables are bumped at the end of both
+        if transaction.parent is None:
+            self.bump(*session.info.pop(self.info_key, ()))
+        elif transaction.nested and transaction.parent.parent is None:
+            self.bump(*session.info.get(self.info_key, ()))
+
+    def table_versions(self, tables):
+        with self._lock:
+            return tuple(self.versions.get(table, 0) for table in tables)
+
+    @staticmethod
+    def _validate(key, content, cache_version, versions=None, max_age=None):
+        stored_versions, stored_at = cache_version
+        if max_age is not None and time.monotonic() - stored_at > max_age:
+            return False
+        return stored_versions == versions
+
+    @staticmethod
+    def cacheable():
+        request = flask.request
+        return request.method == 'GET' and 'Authorization' not in request.headers
+
+    @staticmethod
+    def key():
+        request = flask.request
+        return request.endpoint, request.url_root, tuple(sorted(request.view_args.items())), \
+            request.query_string.decode('latin_1')
+
+    def lookup(self, key, versions, max_age=None):
+        """
+        Get the cached response for key if it was built from the given table versions, None otherwise
+        """
+        cached = self.cache.lookup(key, versions=versions, max_age=max_age)
+        if cached is None:
+            return None
+        body, status, headers = cached
+        return flask.current_app.response_class(body, status=status, headers=headers)
+
+    def store(self, key, versions, response):
+        if response.status_code != 200 or response.direct_passthrough or response.is_streamed:
+            return
+        cached = (response.get_data(), response.status_code, response.headers.to_wsgi_list())
+        self.cache.store(key, cached, version=(versions, time.monotonic()))
+
+
+response_cache = ResponseCache()
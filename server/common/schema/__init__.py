@@ -1,16 +1,23 @@
 from .category import CategorySchema
-from .change import ChangeSchema
-from .event import EventSchema
+from .change import ChangeSchema, ChangePageSchema
+from .content_patch import ContentPatchSchema
+from .event import EventSchema, EventPageSchema
 from .event_filter import EventFilterSchema
 from .file import FileSchema
-from .gallery import GallerySchema
+from .gallery import GallerySchema, GalleryPageSchema
 from .login import LoginSchema
-from .media import MediaSchema
+from .media import MediaSchema, MediaPageSchema
+from .media_file import MediaFileSchema
 from .media_id import MediaIdSchema
 from .page import PageSchema
+from .pagination import PaginationSchema
 from .ref import ma
+from .revision_filter import RevisionFilterSchema
+from .site import SiteSchema
 from .token import TokenSchema
-from .user import UserSchema
+from .user import UserSchema, UserPageSchema
 
 __all__ = ['ma', 'UserSchema', 'MediaSchema', 'EventSchema', 'PageSchema', 'CategorySchema', 'GallerySchema',
-           'LoginSchema', 'TokenSchema', 'FileSchema', 'MediaIdSchema', 'EventFilterSchema', 'ChangeSchema']
+           'LoginSchema', 'TokenSchema', 'FileSchema', 'MediaIdSchema', 'EventFilterSchema', 'ChangeSchema',
+           'RevisionFilterSchema', 'ContentPatchSchema', 'SiteSchema', 'PaginationSchema', 'UserPageSchema',
+           'MediaPageSchema', 'GalleryPageSchema', 'EventPageSchema', 'ChangePageSchema', 'MediaFileSchema']
@@ -1,7 +1,8 @@
-from marshmallow import fields, validate
+from marshmallow import fields
 
 from server.common.database import Change
-from server.common.schema.ref import ma
+from server.common.schema.pagination import paginated
+from server.common.schema.ref import ma, DiffField
 
 
 class ChangeSchema(ma.SQLAlchemyAutoSchema):
@@ -11,7 +12,7 @@ class ChangeSchema(ma.SQLAlchemyAutoSchema):
         dump_only = fields
         include_fk = True
 
-    data = fields.List(fields.Tuple((fields.Int(validate=validate.Range(-1, 1)), fields.String)))
+    data = DiffField()
     author = fields.UUID()
     _links = ma.Hyperlinks({
         'collection': ma.URLFor('changes', values={'category_id': '<category>', 'page_id': '<page>'}),
@@ -21,3 +22,5 @@ class ChangeSchema(ma.SQLAlchemyAutoSchema):
 
 
 Change.__marshmallow__ = ChangeSchema
+
+ChangePageSchema = paginated(ChangeSchema)
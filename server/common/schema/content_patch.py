@@ -0,0 +1,14 @@
+from marshmallow import fields, validates_schema, ValidationError
+
+from server.common.schema.ref import ma
+
+
+class ContentPatchSchema(ma.Schema):
+    base = fields.String(required=True, metadata={'description': 'The ETag of the content the edit was made on'})
+    delta = fields.String(required=False, metadata={'description': 'A diff-match-patch delta'})
+    patch = fields.String(required=False, metadata={'description': 'A diff-match-patch patch in text form'})
+
+    @validates_schema
+    def validate_edit(self, data, **kwargs):
+        if ('delta' in data) == ('patch' in data):
+            raise ValidationError('Exactly one of delta and patch is required')
@@ -1,7 +1,100 @@
+import flask
+from flask_marshmallow.fields import URLFor as BaseURLFor, _tpl
+from marshmallow import fields, missing
 from marshmallow.fields import Field
+from marshmallow.utils import get_value
+from werkzeug.urls import url_quote, url_encode
 
 
 class FileField(Field):
     def __init__(self, **additional_metadata):
         additional_metadata.update(location='files')
         super().__init__(**additional_metadata)
+
+
+class DiffField(Field):
+    """
+    A change as diff-match-patch delta string or, for legacy changes, as list of (operation, text) pairs
+    """
+    legacy = fields.List(fields.Tuple((fields.Int(), fields.String())))
+
+    def _serialize(self, value, attr, obj, **kwargs):
+        if value is None or isinstance(value, str):
+            return value
+        return self.legacy._serialize(value, attr, obj, **kwargs)
+
+
+class URLTemplate:
+    """
+    The rule of an endpoint compiled to a format string and the converters of its arguments
+    """
+
+    def __init__(self, rule, values):
+        url_map = rule.map
+        path, arguments = [], []
+        seen_domain = False
+        for is_dynamic, data in rule._trace:
+            if not seen_domain:
+                seen_domain = data == '|'
+            elif is_dynamic:
+                path.append('%s')
+                arguments.append((rule._converters[data], _tpl(str(values[data]))))
+            else:
+                path.append(url_quote(data, url_map.charset, safe='/:|+').replace('%', '%%'))
+        query = {name: value for name, value in values.items() if name not in rule.arguments}
+        self.format = ''.join(path).lstrip('/')
+        if query:
+            self.format += '?' + url_encode(query, url_map.charset, sort=url_map.sort_parameters,
+                                            key=url_map.sort_key).replace('%', '%%')
+        self.arguments = arguments
+
+    @classmethod
+    def compile(cls, app, endpoint, values):
+        """
+        Compile the rule of endpoint, or return None if the URL can only be built by url_for
+
+        Only endpoints with a single rule without defaults or subdomain are compiled, whose arguments are all
+        taken from attributes and whose query arguments are all constant.
+        """
+        rules = app.url_map._rules_by_endpoint.get(endpoint, [])
+        if len(rules) != 1 or app.url_map.host_matching or app.url_default_functions:
+            return None
+        rule = rules[0]
+        if rule.defaults or rule.subdomain or not rule.arguments <= set(values) or \
+                any(name.startswith('_') for name in values):
+            return None
+        if any(_tpl(str(value)) for name, value in values.items() if name not in rule.arguments):
+            return None
+        return cls(rule, values)
+
+    def build(self, script_name, obj):
+        arguments = []
+        for converter, attr_name in self.arguments:
+            value = get_value(obj, attr_name, default=missing)
+            if value is None:
+                return None
+            if value is missing:
+                raise AttributeError(f'{attr_name!r} is not a valid attribute of {obj!r}')
+            arguments.append(converter.to_url(value))
+        return '%s/%s' % (script_name.rstrip('/'), self.format % tuple(arguments))
+
+
+class URLFor(BaseURLFor):
+    """
+    URLFor that builds the URL from a template compiled once per app instead of calling url_for for every object
+
+    The URLs are identical to the ones built by url_for, endpoints that can not be compiled still use url_for.
+    """
+
+    def _template(self, app):
+        compiled = self.__dict__.get('_compiled')
+        if compiled is None or compiled[0] is not app:
+            compiled = self._compiled = (app, URLTemplate.compile(app, self.endpoint, self.values))
+        return compiled[1]
+
+    def _serialize(self, value, key, obj):
+        context = flask._request_ctx_stack.top
+        template = self._template(context.app) if context is not None and context.url_adapter is not None else None
+        if template is None or context.url_adapter.subdomain != context.app.url_map.default_subdomain:
+            return super()._serialize(value, key, obj)
+        return template.build(context.url_adapter.script_name, obj)
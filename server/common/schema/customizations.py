@@ -11,7 +11,7 @@ from marshmallow_sqlalchemy import ModelConverter as BaseModelConverter
 from werkzeug.routing import Rule
 
 from server.common.doc import doc
-from server.common.schema.custom_fields import FileField
+from server.common.schema.custom_fields import FileField, DiffField
 
 special_names = {
     'collection_post': 'create',
@@ -74,6 +74,20 @@ def tuple2properties(self, field, **kwargs):
     return ret
 
 
+# noinspection PyUnusedLocal
+def diff2properties(self, field, **kwargs):
+    """
+    Add an OpenAPI extension for server.common.schema.custom_fields.DiffField instances
+    """
+    ret = {}
+    if isinstance(field, DiffField):
+        ret['oneOf'] = [
+            {'type': 'string', 'description': 'diff-match-patch delta'},
+            {'type': 'array', 'items': self.field2property(field.legacy.inner)}
+        ]
+    return ret
+
+
 def make_link(rule, field, method='get'):
     rule = rule.replace('/', '~1')
     link = {
@@ -1,6 +1,7 @@
 from marshmallow import fields
 
 from server.common.database import Event
+from server.common.schema.pagination import paginated
 from server.common.schema.ref import ma
 
 
@@ -21,3 +22,5 @@ class EventSchema(ma.SQLAlchemyAutoSchema):
 
 
 Event.__marshmallow__ = EventSchema
+
+EventPageSchema = paginated(EventSchema)
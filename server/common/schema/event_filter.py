@@ -1,8 +1,8 @@
 from marshmallow import fields
 
-from server.common.schema.ref import ma
+from server.common.schema.pagination import PaginationSchema
 
 
-class EventFilterSchema(ma.Schema):
+class EventFilterSchema(PaginationSchema):
     start = fields.DateTime(required=False)
     end = fields.DateTime(required=False)
@@ -2,6 +2,7 @@ from marshmallow import fields
 
 from server.common.database import Gallery
 from server.common.schema.media import MediaSchema
+from server.common.schema.pagination import paginated
 from server.common.schema.ref import ma
 
 
@@ -24,3 +25,5 @@ class GallerySchema(ma.SQLAlchemyAutoSchema):
 
 
 Gallery.__marshmallow__ = GallerySchema
+
+GalleryPageSchema = paginated(GallerySchema)
@@ -1,14 +1,16 @@
 from marshmallow import fields
 
 from server.common.database import Media
-from server.common.schema.ref import ma
+from server.common.schema.pagination import paginated
+from server.common.schema.ref import ma, ModelConverter
 
 
 class MediaSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
         model = Media
-        fields = ('id', 'name', 'mimetype', 'extension', 'owner', '_links')
-        dump_only = ('id', 'owner', '_links')
+        model_converter = ModelConverter
+        fields = ('id', 'name', 'mimetype', 'extension', 'owner', 'status', '_links')
+        dump_only = ('id', 'owner', 'status', '_links')
         include_fk = True
 
     id = fields.UUID()
@@ -23,3 +25,5 @@ class MediaSchema(ma.SQLAlchemyAutoSchema):
 
 
 Media.__marshmallow__ = MediaSchema
+
+MediaPageSchema = paginated(MediaSchema)
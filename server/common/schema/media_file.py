@@ -0,0 +1,17 @@
+from marshmallow import fields
+from marshmallow.validate import OneOf, Range
+
+from server.common.imaging import FITS
+from server.common.schema.ref import ma
+
+
+class MediaFileSchema(ma.Schema):
+    variant = fields.String(required=False, metadata={'description': 'The name of one of the prepared sizes'})
+    thumb = fields.String(required=False, metadata={'description': 'Get the thumbnail, same as variant=thumb'})
+    w = fields.Integer(required=False, validate=[Range(min=1)],
+                       metadata={'description': 'The width the image is scaled to, one of MEDIA_RESIZE_SIZES'})
+    h = fields.Integer(required=False, validate=[Range(min=1)],
+                       metadata={'description': 'The height the image is scaled to, one of MEDIA_RESIZE_SIZES'})
+    fit = fields.String(required=False, missing='contain', validate=[OneOf(FITS)],
+                        metadata={'description': 'Whether the image is cropped to cover w and h '
+                                                 'or scaled to be contained by them'})
@@ -0,0 +1,23 @@
+from marshmallow import fields
+from marshmallow.validate import Range
+
+from server.common.schema.ref import ma
+
+
+class PaginationSchema(ma.Schema):
+    limit = fields.Integer(required=False, validate=[Range(min=1)],
+                           metadata={'description': 'The maximum number of items in the response'})
+    cursor = fields.String(required=False,
+                           metadata={'description': 'The cursor from the next link of the previous response'})
+
+
+def paginated(schema):
+    """
+    Create the schema of a page of items of schema, holding the items and the links to this and the next page
+    """
+    name = schema.__name__.replace('Schema', 'PageSchema')
+    return type(name, (ma.Schema,), {
+        '__envelope__': 'items',
+        'items': fields.Nested(schema, many=True),
+        '_links': fields.Dict(keys=fields.String(), values=fields.String())
+    })
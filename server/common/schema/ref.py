@@ -1,9 +1,12 @@
 from flask_marshmallow import Marshmallow
 
-__all__ = ['ma', 'ModelConverter', 'marshmallow_plugin', 'FileField', 'enum2properties', 'tuple2properties']
+__all__ = ['ma', 'ModelConverter', 'marshmallow_plugin', 'FileField', 'DiffField', 'URLFor', 'enum2properties',
+           'tuple2properties', 'diff2properties']
 
-from .custom_fields import FileField
-from .customizations import MarshmallowPlugin, resolver, ModelConverter, enum2properties, tuple2properties
+from .custom_fields import FileField, DiffField, URLFor
+from .customizations import MarshmallowPlugin, resolver, ModelConverter, enum2properties, tuple2properties, \
+    diff2properties
 
 ma = Marshmallow()
+ma.URLFor = ma.UrlFor = URLFor
 marshmallow_plugin = MarshmallowPlugin(resolver)
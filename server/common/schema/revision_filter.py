@@ -0,0 +1,14 @@
+from marshmallow import fields, validates_schema, ValidationError
+from marshmallow.validate import Range
+
+from server.common.schema.ref import ma
+
+
+class RevisionFilterSchema(ma.Schema):
+    revision = fields.Int(required=False, validate=[Range(min=0)])
+    at = fields.DateTime(required=False)
+
+    @validates_schema
+    def validate_selector(self, data, **kwargs):
+        if ('revision' in data) == ('at' in data):
+            raise ValidationError('Exactly one of revision and at is required')
@@ -0,0 +1,48 @@
+from marshmallow import fields
+
+from server.common.database import Category, Gallery
+from server.common.schema.category import CategorySchema
+from server.common.schema.event import EventSchema
+from server.common.schema.page import PageSchema
+from server.common.schema.ref import ma
+
+
+class SiteCategorySchema(CategorySchema):
+    class Meta:
+        model = Category
+        fields = ('id', 'title', 'order', 'pages', '_links')
+        dump_only = ('pages', '_links')
+
+    pages = fields.Nested(PageSchema, many=True)
+
+
+class GallerySummarySchema(ma.SQLAlchemyAutoSchema):
+    class Meta:
+        model = Gallery
+        fields = ('id', 'title', 'owner', 'media_count', '_links')
+        dump_only = ('id', 'owner', 'media_count', '_links')
+        include_fk = True
+
+    id = fields.UUID()
+    owner = ma.auto_field('owner_id')
+    media_count = fields.Integer()
+    _links = ma.Hyperlinks({
+        'self': ma.URLFor('gallery', values={'gallery_id': '<id>'}),
+        'collection': ma.URLFor('galleries')
+    })
+
+
+class SiteSchema(ma.Schema):
+    class Meta:
+        fields = ('categories', 'events', 'galleries', '_links')
+        dump_only = ('categories', 'events', 'galleries', '_links')
+
+    categories = fields.Nested(SiteCategorySchema, many=True)
+    events = fields.Nested(EventSchema, many=True)
+    galleries = fields.Nested(GallerySummarySchema, many=True)
+    _links = ma.Hyperlinks({
+        'self': ma.URLFor('site'),
+        'categories': ma.URLFor('categories'),
+        'events': ma.URLFor('events'),
+        'galleries': ma.URLFor('galleries')
+    })
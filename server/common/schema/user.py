@@ -1,6 +1,7 @@
 from marshmallow import fields
 
 from server.common.database import User
+from server.common.schema.pagination import paginated
 from server.common.schema.ref import ma, ModelConverter
 
 
@@ -22,3 +23,4 @@ class UserSchema(ma.SQLAlchemyAutoSchema):
 
 User.__marshmallow__ = UserSchema
 
+UserPageSchema = paginated(UserSchema)
@@ -1,6 +1,6 @@
-from .datastructures import CacheDict
+from .datastructures import CacheDict, CacheResult
 from .decorators import *
 from .exceptions import *
 from .json import JSONEncoder
 
-__all__ = ['JSONEncoder', 'CacheDict'] + decorators.__all__ + exceptions.__all__
+__all__ = ['JSONEncoder', 'CacheDict', 'CacheResult'] + decorators.__all__ + exceptions.__all__
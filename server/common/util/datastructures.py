@@ -1,35 +1,384 @@
+import json
+import os
+import pickle
+import random
+import sqlite3
+import time
+import weakref
+from collections import namedtuple, OrderedDict
+from collections.abc import MutableMapping
 from datetime import datetime
-from threading import RLock
+from threading import Event, Lock, RLock, local
 
+__all__ = ['CacheDict', 'CacheResult', 'MemoryBackend', 'SQLiteBackend']
 
-class CacheDict(dict):
-    _locks = {}
-    _updates = {}
+CacheResult = namedtuple('CacheResult', ('value', 'stale'))
 
-    def __init__(self, cache_fn, validate_fn=None):
-        super().__init__()
+
+def _size(value):
+    return len(pickle.dumps(value))
+
+
+class MemoryBackend:
+    """
+    Keeps the cached entries in the memory of the current process
+
+    Once max_entries or max_bytes is exceeded the least recently (lru) or least frequently (lfu) used entries are
+    dropped. The size of an entry is the length of its pickled value.
+    """
+
+    shared = False
+
+    def __init__(self, max_entries=None, max_bytes=None, policy='lru'):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._lock = Lock()
+        self._data = OrderedDict()
+        self._uses = {}
+        self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if self.policy == 'lfu':
+                self._uses[key] += 1
+            else:
+                self._data.move_to_end(key)
+            return entry[0], entry[1]
+
+    def set(self, key, value, version):
+        size = _size(value)
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (value, version, size)
+            self._uses[key] = 1
+            self._bytes += size
+            return self._evict(key)
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return False
+        self._uses.pop(key)
+        self._bytes -= entry[2]
+        return True
+
+    def _over_limit(self):
+        return (self.max_entries is not None and len(self._data) > self.max_entries) or \
+               (self.max_bytes is not None and self._bytes > self.max_bytes)
+
+    def _evict(self, keep):
+        evicted = []
+        while self._over_limit() and len(self._data) > 1:
+            candidates = (key for key in self._data if key != keep)
+            if self.policy == 'lfu':
+                key = min(candidates, key=self._uses.__getitem__)
+            else:
+                key = next(candidates)
+            self._remove(key)
+            evicted.append(key)
+        return evicted
+
+    def delete(self, key):
+        with self._lock:
+            return self._remove(key)
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def size(self):
+        with self._lock:
+            return len(self._data), self._bytes
+
+
+class SQLiteBackend:
+    """
+    Keeps the cached entries in a sqlite file that is shared by every process on the node
+
+    The file is opened in WAL mode and memory mapped, so all workers read the same pages from the OS page cache.
+    The limits and the eviction policy are the same as for the MemoryBackend and apply to the whole file.
+    To keep reads from writing to the file on every hit, lru only refreshes the last use of an entry once it is
+    older than usage_interval seconds and lfu counts a random usage_sample fraction of the hits, each weighted by
+    its inverse.
+    """
+
+    columns = ['key', 'version', 'value', 'size', 'used']
+    shared = True
+
+    def __init__(self, path, table, mmap_size=256 * 1024 * 1024, max_entries=None, max_bytes=None, policy='lru',
+                 usage_interval=60, usage_sample=0.1):
+        self.path = path
+        self.table = table
+        self.mmap_size = mmap_size
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.usage_interval = usage_interval
+        self.usage_sample = usage_sample
+        self._local = local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # connections must neither be shared between threads nor survive a fork
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+            columns = [row[1] for row in connection.execute(f'PRAGMA table_info("{self.table}")')]
+            if columns and columns != self.columns:
+                # the file was written by an older layout, which is just a cache and can be thrown away
+                connection.execute(f'DROP TABLE "{self.table}"')
+            connection.execute(f'CREATE TABLE IF NOT EXISTS "{self.table}" (key TEXT PRIMARY KEY, version BLOB, '
+                               f'value BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    @staticmethod
+    def _dump_key(key):
+        return json.dumps(key)
+
+    @staticmethod
+    def _load_key(key):
+        key = json.loads(key)
+        return tuple(key) if isinstance(key, list) else key
+
+    def _used(self, used):
+        # the new value of the used column for a hit or None if it is not recorded
+        if self.max_entries is None and self.max_bytes is None:
+            return None
+        if self.policy == 'lfu':
+            return used + 1 / self.usage_sample if random.random() < self.usage_sample else None
+        now = time.time()
+        return now if now - used >= self.usage_interval else None
+
+    def get(self, key):
+        key = self._dump_key(key)
+        row = self.connection.execute(f'SELECT value, version, used FROM "{self.table}" WHERE key = ?',
+                                      (key,)).fetchone()
+        if row is None:
+            return None
+        used = self._used(row[2])
+        if used is not None:
+            self.connection.execute(f'UPDATE "{self.table}" SET used = ? WHERE key = ?', (used, key))
+        return pickle.loads(row[0]), pickle.loads(row[1])
+
+    def set(self, key, value, version):
+        value = pickle.dumps(value)
+        used = 1 if self.policy == 'lfu' else time.time()
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(f'INSERT OR REPLACE INTO "{self.table}" (key, version, value, size, used) '
+                               f'VALUES (?, ?, ?, ?, ?)',
+                               (self._dump_key(key), pickle.dumps(version), value, len(value), used))
+            evicted = self._evict(connection, self._dump_key(key))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return evicted
+
+    def _evict(self, connection, keep):
+        if self.max_entries is None and self.max_bytes is None:
+            return []
+        entries, total = connection.execute(f'SELECT count(*), coalesce(sum(size), 0) FROM "{self.table}"').fetchone()
+        evicted = []
+        rows = connection.execute(f'SELECT key, size FROM "{self.table}" WHERE key != ? ORDER BY used', (keep,))
+        for key, size in rows:
+            if (self.max_entries is None or entries <= self.max_entries) and \
+                    (self.max_bytes is None or total <= self.max_bytes):
+                break
+            evicted.append(key)
+            entries, total = entries - 1, total - size
+        rows.close()
+        connection.executemany(f'DELETE FROM "{self.table}" WHERE key = ?', [(key,) for key in evicted])
+        return [self._load_key(key) for key in evicted]
+
+    def delete(self, key):
+        cursor = self.connection.execute(f'DELETE FROM "{self.table}" WHERE key = ?', (self._dump_key(key),))
+        return cursor.rowcount > 0
+
+    def keys(self):
+        return [self._load_key(row[0]) for row in self.connection.execute(f'SELECT key FROM "{self.table}"')]
+
+    def size(self):
+        return tuple(self.connection.execute(f'SELECT count(*), coalesce(sum(size), 0) FROM "{self.table}"').fetchone())
+
+
+class _Flight:
+    def __init__(self, version):
+        self.version = version
+        self.done = Event()
+        self.value = None
+        self.error = None
+
+
+class CacheDict(MutableMapping):
+    """
+    A mapping whose values are computed by cache_fn and checked by validate_fn before they are used
+
+    The entries are kept by a MemoryBackend or SQLiteBackend, which bound the cache by entry count and size.
+    Hits, misses and evictions are counted per cache and reported by statistics().
+    """
+    _instances = weakref.WeakValueDictionary()
+
+    def __init__(self, cache_fn, validate_fn=None, name='cache', backend=None):
         self.cache_fn = cache_fn
         self.validate_fn = validate_fn
+        self.name = name
+        self.backend = backend or MemoryBackend()
+        self._locks = {}
+        self._flights = {}
+        self._flights_lock = Lock()
+        self._stats_lock = Lock()
+        self._stats = dict.fromkeys(('hits', 'misses', 'evictions', 'coalesced', 'stale'), 0)
+        self._instances[id(self)] = self
+
+    def init_app(self, app, backend=None):
+        backend = backend or app.config.get('CACHE_BACKEND', 'memory')
+        limits = {
+            'max_entries': app.config.get('CACHE_MAX_ENTRIES'),
+            'max_bytes': app.config.get('CACHE_MAX_BYTES'),
+            'policy': app.config.get('CACHE_EVICTION', 'lru')
+        }
+        if limits['policy'] not in ('lru', 'lfu'):
+            raise ValueError(f'Unknown cache eviction policy {limits["policy"]}')
+        if backend == 'memory':
+            self.backend = MemoryBackend(**limits)
+        elif backend == 'sqlite':
+            path = app.config.get('CACHE_PATH') or os.path.join(app.instance_path, 'cache.sqlite')
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.backend = SQLiteBackend(path, self.name, app.config.get('CACHE_MMAP_SIZE', 256 * 1024 * 1024),
+                                         usage_interval=app.config.get('CACHE_USAGE_INTERVAL', 60),
+                                         usage_sample=app.config.get('CACHE_USAGE_SAMPLE', 0.1), **limits)
+        else:
+            raise ValueError(f'Unknown cache backend {backend}')
+
+    def __getitem__(self, key):
+        entry = self.backend.get(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry[0]
+
+    def __setitem__(self, key, value):
+        self.store(key, value)
+
+    def __delitem__(self, key):
+        self._locks.pop(key, None)
+        if not self.backend.delete(key):
+            raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.backend.keys())
+
+    def __len__(self):
+        return self.backend.size()[0]
 
     def invalidate(self, key):
-        self.pop(key)
+        self.pop(key, None)
+
+    def cache(self, key, *args, version=None, **kwargs):
+        with self.lock(key):
+            self.store(key, self.cache_fn(*args, **kwargs), version=version)
 
-    def cache(self, key, *args, **kwargs):
+    def store(self, key, value, version=None):
         with self.lock(key):
-            self[key] = self.cache_fn(*args, **kwargs)
-            self._updates[key] = datetime.now()
+            evicted = self.backend.set(key, value, datetime.now() if version is None else version)
+        for evicted_key in evicted:
+            self._locks.pop(evicted_key, None)
+        self._count('evictions', len(evicted))
 
     def lock(self, key):
-        if key not in self._locks:
-            self._locks[key] = RLock()
-        return self._locks[key]
+        return self._locks.setdefault(key, RLock())
 
-    def should_cache(self, key, *args, **kwargs):
-        if key not in self:
-            return True
-        if key not in self._updates:
-            return True
+    def _count(self, stat, value=1):
+        if value:
+            with self._stats_lock:
+                self._stats[stat] += value
+
+    def stats(self):
+        """
+        Get the hit, miss and eviction counters of this worker together with the current size of the cache
+        """
+        entries, size = self.backend.size()
+        with self._stats_lock:
+            return {**self._stats, 'entries': entries, 'bytes': size, 'locks': len(self._locks)}
+
+    @classmethod
+    def statistics(cls):
+        return {cache.name: cache.stats() for cache in list(cls._instances.values())}
+
+    def _is_valid(self, key, entry, args, kwargs):
+        if entry is None:
+            return False
         if self.validate_fn:
-            kwargs.update(key=key, content=self[key], cache_version=self._updates[key])
-            return not self.validate_fn(*args, **kwargs)
-        return False
+            content, cache_version = entry
+            kwargs.update(key=key, content=content, cache_version=cache_version)
+            return self.validate_fn(*args, **kwargs)
+        return True
+
+    def should_cache(self, key, *args, **kwargs):
+        return not self._is_valid(key, self.backend.get(key), args, kwargs)
+
+    def lookup(self, key, *args, **kwargs):
+        """
+        Get the cached value for key if it is still valid, None otherwise
+        """
+        entry = self.backend.get(key)
+        valid = self._is_valid(key, entry, args, kwargs)
+        self._count('hits' if valid else 'misses')
+        return entry[0] if valid else None
+
+    def get_or_compute(self, key, *args, version=None, stale=False, validate=None, **kwargs):
+        """
+        Get the cached value for key, computing it with cache_fn(*args, **kwargs) if it is missing or not valid
+
+        Only one thread of the process computes a key at a time. The other threads asking for the same version wait
+        for its result or, with stale set, get the outdated cached value right away flagged as stale.
+
+        :param validate: The keyword arguments passed to validate_fn
+        """
+        validate = validate or {}
+        while True:
+            entry = self.backend.get(key)
+            if self._is_valid(key, entry, (), dict(validate)):
+                self._count('hits')
+                return CacheResult(entry[0], False)
+
+            with self._flights_lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight(version)
+            if leader:
+                return CacheResult(self._compute(key, flight, args, kwargs), False)
+
+            self._count('coalesced')
+            if stale and entry is not None:
+                self._count('stale')
+                return CacheResult(entry[0], True)
+            flight.done.wait()
+            if flight.version == version:
+                if flight.error is not None:
+                    raise flight.error
+                return CacheResult(flight.value, False)
+
+    def _compute(self, key, flight, args, kwargs):
+        self._count('misses')
+        try:
+            flight.value = self.cache_fn(*args, **kwargs)
+            self.store(key, flight.value, version=flight.version)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            flight.done.set()
@@ -1,5 +1,7 @@
+import json
 import re
-from functools import wraps
+from collections.abc import Mapping
+from functools import wraps, lru_cache
 
 import flask
 import werkzeug
@@ -8,12 +10,16 @@ from flask_apispec.annotations import annotate
 from flask_apispec.wrapper import Wrapper as OriginalWrapper, identity, MARSHMALLOW_VERSION_INFO
 from flask_apispec.wrapper import unpack, packed
 from flask_jwt_extended import get_jwt_claims, jwt_required as _jwt_required
+from flask_marshmallow.fields import Hyperlinks
+from marshmallow import Schema, fields
+from webargs import flaskparser
 from werkzeug.exceptions import HTTPException
 
-from .exceptions import AuthorisationError, ServerError
+from .exceptions import AuthorisationError, ServerError, RequestError
+from .json import JSONEncoder
 
 __all__ = ['admin_required', 'lazy_property', 'autodoc', 'write_only_property', 'tag', 'params',
-           'marshal_with', 'use_kwargs', 'transactional', 'jwt_required', 'op_id']
+           'marshal_with', 'use_kwargs', 'transactional', 'jwt_required', 'op_id', 'cache_response']
 
 
 def transactional(session):
@@ -155,7 +161,7 @@ def op_id(op_id):
     return doc(operationId=op_id)
 
 
-def marshal_with(schema, code='default', description='', content_type=None, inherit=None, apply=None):
+def marshal_with(schema, code='default', description='', content_type=None, inherit=None, apply=None, stream=False):
     """Marshal the return value of the decorated view function using the
     specified schema.
 
@@ -177,6 +183,9 @@ def marshal_with(schema, code='default', description='', content_type=None, inhe
     :param content_type: Optional response content type header (only used in OpenAPI 3.x)
     :param inherit: Inherit schemas from parent classes
     :param apply: Marshal response with specified schema
+    :param stream: Send the response as a chunked JSON document, serializing the items of many=True schemas
+        and nested many=True fields one at a time while the result is iterated. It is formatted with RESTFUL_JSON
+        like the other responses, except that the streamed fields come before the other keys.
     """
     def wrapper(func):
         options = {
@@ -184,6 +193,7 @@ def marshal_with(schema, code='default', description='', content_type=None, inhe
                 'schema': schema or {},
                 'description': description,
                 'content_type': content_type,
+                'stream': stream,
             },
         }
         annotate(func, 'schemas', [options], inherit=inherit, apply=apply)
@@ -191,6 +201,20 @@ def marshal_with(schema, code='default', description='', content_type=None, inhe
     return wrapper
 
 
+def cache_response(*tables, max_age=None):
+    """Serve anonymous GET requests to the decorated view from the response cache
+    until one of the tables is written to.
+
+    :param tables: Names of the tables the response is built from
+    :param max_age: Optional number of seconds after which the response is built again, for responses that
+        depend on the current time
+    """
+    def wrapper(func):
+        annotate(func, 'response_cache', [{'tables': tables, 'max_age': max_age}])
+        return activate(func)
+    return wrapper
+
+
 def activate(func):
     if isinstance(func, type) or getattr(func, '__apispec__', {}).get('wrapped'):
         return func
@@ -198,15 +222,71 @@ def activate(func):
     @wraps(func)
     def wrapped(*args, **kwargs):
         instance = args[0] if func.__apispec__.get('ismethod') else None
-        annotation = utils.resolve_annotations(func, 'wrapper', instance)
-        wrapper_cls = utils.merge_recursive(annotation.options).get('wrapper', Wrapper)
-        wrapper = wrapper_cls(func, instance)
-        return wrapper(*args, **kwargs)
+        pipeline = get_pipeline(func, instance)
+        return pipeline.wrapper(func, instance, pipeline)(*args, **kwargs)
 
     wrapped.__apispec__['wrapped'] = True
     return wrapped
 
 
+def _link_fields(schema_cls, prefix='', depth=0):
+    paths = []
+    for name, field in schema_cls._declared_fields.items():
+        if isinstance(field, Hyperlinks):
+            paths.append(prefix + name)
+        elif isinstance(field, fields.Nested) and depth < 4:
+            nested = field.nested if isinstance(field.nested, type) else type(field.nested)
+            paths.extend(_link_fields(nested, f'{prefix}{name}.', depth + 1))
+    return paths
+
+
+@lru_cache(maxsize=256)
+def _sparse_schema(schema_cls, many, only, links):
+    envelope = getattr(schema_cls, '__envelope__', None)
+    if only is not None and envelope:
+        only = (*(f'{envelope}.{name}' for name in only), *(name for name in schema_cls._declared_fields
+                                                          if name != envelope))
+    exclude = () if links else tuple(_link_fields(schema_cls))
+    schema = schema_cls(many=many, only=only, exclude=exclude)
+    _check_nested(schema)
+    return schema
+
+
+def _check_nested(schema):
+    # nested schemas only check the names passed down to them once they are built, which would be while dumping
+    for field in schema.fields.values():
+        if isinstance(field, fields.Nested) and (field.only is not None or field.exclude):
+            _check_nested(field.schema)
+
+
+def sparse_schema(schema, request):
+    """Get the variant of schema that only dumps the fields listed in the fields query argument
+    and leaves out the links of the objects when links is false.
+
+    The variants are built once and reused, the envelope of paginated schemas is always dumped.
+    """
+    only = request.args.get('fields')
+    links = request.args.get('links', 'true').lower() not in ('false', '0', 'no')
+    if not isinstance(schema, Schema) or request.method != 'GET' or (only is None and links):
+        return schema
+    only = tuple(sorted({name.strip() for name in only.split(',') if name.strip()})) if only is not None else None
+    try:
+        return _sparse_schema(type(schema), schema.many, only, links)
+    except ValueError as e:
+        raise RequestError(str(e))
+
+
+def _json_settings():
+    # the arguments flask-restful's output_json dumps the buffered responses with
+    app = flask.current_app
+    settings = dict(app.config.get('RESTFUL_JSON', {}))
+    settings.setdefault('cls', JSONEncoder)
+    if app.debug:
+        settings.setdefault('indent', 4)
+        settings.setdefault('sort_keys', False)
+    return settings
+
+
 # noinspection PyPep8Naming
 class write_only_property(property):
     # noinspection PyShadowingNames
@@ -214,18 +294,101 @@ class write_only_property(property):
         super().__init__(fget=fget, fset=fset, fdel=fdel, doc=doc)
 
 
+def _prepare_schema(schema):
+    # schema classes are instantiated once, factories depend on the request and are called per request
+    if isinstance(schema, type) and issubclass(schema, Schema):
+        return schema()
+    return schema
+
+
+class ViewPipeline:
+    """The annotations of a view function resolved once for the class it is bound to
+
+    Every request to the view reuses the merged options and the schema instances built here.
+    """
+
+    def __init__(self, func, instance=None):
+        args = utils.resolve_annotations(func, 'args', instance)
+        self.args = [(_prepare_schema(option['args']), option['kwargs']['location'])
+                     for option in args.options] if args.apply is not False else []
+        schemas = utils.resolve_annotations(func, 'schemas', instance)
+        self.marshal = schemas.apply is not False
+        self.schemas = utils.merge_recursive(schemas.options)
+        self.response_cache = utils.merge_recursive(
+            utils.resolve_annotations(func, 'response_cache', instance).options)
+        self.wrapper = utils.merge_recursive(
+            utils.resolve_annotations(func, 'wrapper', instance).options).get('wrapper', Wrapper)
+        self._responses = {}
+
+    def response(self, status_code):
+        """Get the marshal_with options and the schema used for responses with status_code"""
+        try:
+            return self._responses[status_code]
+        except KeyError:
+            option = self.schemas.get(status_code, self.schemas.get('default'))
+            schema = _prepare_schema(option['schema']) if option and option['schema'] and self.marshal else None
+            return self._responses.setdefault(status_code, (option, schema))
+
+
+_pipelines = {}
+
+
+def get_pipeline(func, instance=None):
+    key = func, type(instance)
+    pipeline = _pipelines.get(key)
+    if pipeline is None:
+        pipeline = _pipelines.setdefault(key, ViewPipeline(func, instance))
+    return pipeline
+
+
 class Wrapper(OriginalWrapper):
+    def __init__(self, func, instance=None, pipeline=None):
+        super().__init__(func, instance)
+        self.pipeline = pipeline or get_pipeline(func, instance)
+
     def __call__(self, *args, **kwargs):
+        options = self.pipeline.response_cache
+        cache = flask.current_app.extensions.get('response_cache') if options else None
+        if cache is None or not cache.cacheable():
+            return self.call_response(*args, **kwargs)
+        key = cache.key()
+        # the versions are read before the view runs, so a write made while it runs is never hidden
+        versions = cache.table_versions(options['tables'])
+        response = cache.lookup(key, versions, options.get('max_age'))
+        if response is None:
+            response = self.call_response(*args, **kwargs)
+            if isinstance(response, werkzeug.Response):
+                cache.store(key, versions, response)
+        return response
+
+    def call_view(self, *args, **kwargs):
+        if self.pipeline.args:
+            parser = flask.current_app.config.get('APISPEC_WEBARGS_PARSER', flaskparser.parser)
+            for schema, location in self.pipeline.args:
+                schema = utils.resolve_schema(schema, request=flask.request)
+                parsed = parser.parse(schema, location=location)
+                if getattr(schema, 'many', False):
+                    args += tuple(parsed)
+                elif isinstance(parsed, Mapping):
+                    kwargs.update(parsed)
+                else:
+                    args += (parsed,)
+        return self.func(*args, **kwargs)
+
+    def call_response(self, *args, **kwargs):
         response = self.call_view(*args, **kwargs)
         if isinstance(response, werkzeug.Response):
             return response
         rv, status_code, headers = unpack(response)
+        option, schema = self.pipeline.response(status_code)
+        if schema is not None and option.get('stream'):
+            return self.stream_result(rv, status_code, headers, schema)
         mv, content_type = self.marshal_result(rv, status_code)
         app = flask.current_app
         api = app.extensions.get('restful', None)
         if api:
             if headers:
-                content_type = headers['Content-Type'] or content_type
+                content_type = headers.get('Content-Type') or content_type
             if content_type:
                 return api.make_response(mv, status_code, headers, fallback_mediatype=content_type)
             return api.make_response(mv, status_code, headers)
@@ -235,13 +398,64 @@ class Wrapper(OriginalWrapper):
     def marshal_result(self, result, status_code):
         config = flask.current_app.config
         format_response = config.get('APISPEC_FORMAT_RESPONSE', flask.jsonify) or identity
-        annotation = utils.resolve_annotations(self.func, 'schemas', self.instance)
-        schemas = utils.merge_recursive(annotation.options)
-        schema = schemas.get(status_code, schemas.get('default'))
-        if schema and annotation.apply is not False:
-            dumped = utils.resolve_schema(schema['schema'], request=flask.request).dump(result)
+        option, schema = self.pipeline.response(status_code)
+        if schema is not None:
+            resolved = sparse_schema(utils.resolve_schema(schema, request=flask.request), flask.request)
+            dumped = resolved.dump(result)
             output = dumped.data if MARSHMALLOW_VERSION_INFO[0] < 3 else dumped
         else:
             output = result
 
-        return format_response(output), schema['content_type']
+        return format_response(output), option and option['content_type']
+
+    def stream_result(self, result, status_code, headers, schema):
+        schema = sparse_schema(utils.resolve_schema(schema, request=flask.request), flask.request)
+        batch_size = flask.current_app.config.get('STREAM_BATCH_SIZE', 100)
+        settings = _json_settings()
+        indent = settings.get('indent')
+        indent = ' ' * indent if isinstance(indent, int) else indent
+        item_separator, key_separator = settings.get('separators') or ((',', ': ') if indent is not None
+                                                                        else (', ', ': '))
+
+        def dumps(value, level=0):
+            # the values are dumped on their own, so their lines are indented to the level they are nested at
+            text = json.dumps(value, **settings)
+            return text.replace('\n', '\n' + indent * level) if indent is not None else text
+
+        def newline(level):
+            return '\n' + indent * level if indent is not None else ''
+
+        def stream_items(items, item_schema, level=0):
+            if hasattr(items, 'yield_per'):
+                items = items.yield_per(batch_size)
+            yield '['
+            index = -1
+            for index, item in enumerate(items):
+                yield (item_separator if index else '') + newline(level + 1) + \
+                    dumps(item_schema.dump(item, many=False), level + 1)
+            yield (newline(level) if index >= 0 else '') + ']'
+
+        def generate():
+            if schema.many:
+                yield from stream_items(result, schema)
+                yield '\n'
+                return
+            streamed = [name for name, field in schema.fields.items()
+                        if isinstance(field, fields.Nested) and field.many and name in result]
+            yield '{'
+            for index, name in enumerate(streamed):
+                yield (item_separator if index else '') + newline(1) + dumps(name) + key_separator
+                yield from stream_items(result[name], schema.fields[name].schema, 1)
+            # the other values are dumped last, they may only be known once the items have been iterated
+            rest = {name: value() if callable(value) else value
+                    for name, value in result.items() if name not in streamed and name in schema.fields}
+            for index, name in enumerate(rest, len(streamed)):
+                yield (item_separator if index else '') + newline(1) + dumps(name) + key_separator + \
+                    dumps(schema.fields[name].serialize(name, rest), 1)
+            yield (newline(0) if streamed or rest else '') + '}\n'
+
+        response = flask.current_app.response_class(flask.stream_with_context(generate()), status=status_code,
+                                                     mimetype='application/json')
+        if headers:
+            response.headers.extend(headers)
+        return response
@@ -4,3 +4,15 @@ import enum
 class Role(enum.Enum):
     admin = 'admin'
     author = 'author'
+
+
+class MediaStatus(enum.Enum):
+    processing = 'processing'
+    ready = 'ready'
+    failed = 'failed'
+
+
+class JobStatus(enum.Enum):
+    pending = 'pending'
+    running = 'running'
+    failed = 'failed'
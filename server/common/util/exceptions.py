@@ -4,6 +4,7 @@ __all__ = ['AuthorisationError',
            'AuthenticationError',
            'ServerError',
            'RequestError',
+           'ConflictError',
            'UserNotFoundError']
 
 
@@ -34,6 +35,10 @@ class RequestError(CustomHTTPException):
     code = 400
 
 
+class ConflictError(CustomHTTPException):
+    code = 409
+
+
 class AuthorisationError(CustomHTTPException):
     code = 401
 
@@ -1,6 +1,9 @@
 import errno
+import hashlib
 import os
 
+from flask import request, send_file
+
 from ..database import db
 
 
@@ -16,3 +19,26 @@ def get_save_path(media_type):
             if exc.errno != errno.EEXIST:
                 raise
     return path
+
+
+def send_media_file(path, mimetype, source=None, max_age=None):
+    """
+    Send the file at path, answering range requests and conditional requests with If-None-Match or If-Modified-Since
+
+    The ETag and Last-Modified header are taken from source, the file path was rendered from, because renderings are
+    touched whenever they are used and rendered again once they were evicted. A file sent with max_age is immutable,
+    without it the client has to revalidate the file every time it is used.
+    """
+    stat = os.stat(source or path)
+    response = send_file(path, mimetype=mimetype, add_etags=False, cache_timeout=max_age or 0,
+                         last_modified=stat.st_mtime)
+    response.set_etag(hashlib.sha1(f'{os.path.basename(path)}:{stat.st_mtime_ns}:{stat.st_size}'.encode())
+                      .hexdigest())
+    if max_age:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.public = None
+        response.cache_control.no_cache = True
+    # werkzeug only sets it on partial responses, players need it on the first one to know they can seek
+    response.accept_ranges = 'bytes'
+    return response.make_conditional(request, accept_ranges=True, complete_length=os.path.getsize(path))
@@ -0,0 +1,49 @@
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+__all__ = ['Metrics', 'metrics']
+
+
+class Metrics:
+    """
+    Counters and value summaries of the current worker process
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._counters = {}
+        self._summaries = {}
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                self._summaries[name] = {'count': 1, 'sum': value, 'min': value, 'max': value}
+            else:
+                summary['count'] += 1
+                summary['sum'] += value
+                summary['min'] = min(summary['min'], value)
+                summary['max'] = max(summary['max'], value)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'summaries': {name: dict(summary) for name, summary in self._summaries.items()}
+            }
+
+
+metrics = Metrics()
@@ -4,6 +4,7 @@ from .content import (
     Pages as PagesResource,
     Page as PageResource,
     PageContent as PageContentResource,
+    PageRevision as PageRevisionResource,
     Changes as ChangesResource
 )
 from .event import (
@@ -19,6 +20,12 @@ from .media import (
     Medias as MediasResource,
     MediaData as MediaDataResource
 )
+from .metrics import (
+    Metrics as MetricsResource
+)
+from .site import (
+    Site as SiteResource
+)
 from .user import (
     Self as SelfResource,
     User as UserResource,
@@ -39,9 +46,12 @@ __all__ = ['SelfResource',
            'PagesResource',
            'PageResource',
            'PageContentResource',
+           'PageRevisionResource',
            'ChangesResource',
            'MediasResource',
            'MediaResource',
            'MediaDataResource',
            'EventResource',
-           'EventsResource']
+           'EventsResource',
+           'MetricsResource',
+           'SiteResource']
@@ -1,49 +1,38 @@
-from diff_match_patch.diff_match_patch import diff_match_patch
-from flask import request
+from flask import request, Response
+from werkzeug.http import quote_etag, unquote_etag
 
+from server.common.content import content_cache, add_change, diff_content, get_content, rendered, render_revision, \
+    revision_at, apply_delta, patch_to_delta, read_content, content_written
 from server.common.database import db
 from server.common.database.category import Category as CategoryModel
 from server.common.database.change import Change as ChangeModel
 from server.common.database.page import Page as PageModel
+from server.common.pagination import paginate
 from server.common.rest import Resource
 from server.common.schema import CategorySchema, PageSchema
-from server.common.schema import ChangeSchema
-from server.common.util import RequestError, params, tag, marshal_with, use_kwargs, CacheDict, \
-    jwt_required, transactional
-
-
-def cache_content(page: PageModel):
-    content = ''
-    for diffs in page.content:
-        patches = diff_maker.patch_make(content, diffs.data)
-        content, _ = diff_maker.patch_apply(patches, content)
-    return content
-
-
-def validate_cache(key, content, cache_version, page_version=None):
-    if not page_version:
-        return False
-    return page_version <= cache_version
-
-
-content_cache = CacheDict(cache_content, validate_cache)
-diff_maker = diff_match_patch()
+from server.common.schema import ChangePageSchema, RevisionFilterSchema, ContentPatchSchema, PaginationSchema
+from server.common.util import RequestError, ConflictError, params, tag, marshal_with, use_kwargs, jwt_required, \
+    transactional, cache_response
+from server.common.util.metrics import metrics
 
 
 @tag('content')
 @params(category_id='The id of the category', page_id='The id of the page')
 class PageContent(Resource):
 
+    @params(**{'If-None-Match': {'in': 'header', 'description': 'The ETag of the content known to the client',
+                                 'schema': {'type': 'string'}}})
     @marshal_with({'type': 'string', 'format': 'markdown'}, code=200, content_type='text/markdown', apply=False)
+    @marshal_with(None, code=304, description='The content has not changed since the ETag was issued')
     def get(self, category_id, page_id):
         """
         ## Get the cached content of the page located at (category_id, page_id)
         """
-        key = (category_id, page_id)
-        page: PageModel = PageModel.query.get_or_404(key)
-        if content_cache.should_cache(key, page_version=page.last_update):
-            content_cache.cache(key, page)
-        return content_cache.get(key, '')
+        content = read_content(category_id, page_id)
+        headers = {'ETag': quote_etag(content.etag), 'Cache-Control': 'no-cache'}
+        if request.if_none_match.contains(content.etag):
+            return Response(status=304, headers=headers)
+        return content.text, 200, headers
 
     @jwt_required
     @marshal_with({'type': 'string', 'format': 'markdown'}, code=201, content_type='text/markdown', apply=False)
@@ -53,37 +42,80 @@ class PageContent(Resource):
         ## Set the new content of the page located at (category_id, page_id)
         ***Requires Authentication***
         """
-        key = (category_id, page_id)
-        page: PageModel = PageModel.query.get_or_404(key)
-        if content_cache.should_cache(key, page_version=page.last_update):
-            content_cache.cache(key, page)
-        old_content = content_cache.get((category_id, page_id), '')
+        page: PageModel = PageModel.query.with_for_update().get_or_404((category_id, page_id))
+        old_content = get_content(page).text
         new_content = request.data.decode('utf_8')
         if not new_content:
             raise RequestError('missing body')
 
-        diffs = diff_maker.diff_main(old_content or '', new_content)
-        diff_maker.diff_cleanupEfficiency(diffs)
-        change = ChangeModel(
-            category=page.category,
-            page=page.id,
-            data=diffs
-        )
-        _transaction.session.add(change)
-        content_cache.cache(key, page)
-        return new_content, 201
+        add_change(_transaction.session, page, diff_content(old_content, new_content), new_content)
+        _transaction.session.flush()
+        content = rendered(new_content)
+        content_cache.store((category_id, page_id), content, version=page.version)
+        content_written(_transaction.session, category_id, page_id)
+        return content.text, 201, {'ETag': quote_etag(content.etag)}
+
+    @jwt_required
+    @use_kwargs(ContentPatchSchema, required=True)
+    @marshal_with(None, code=204, description='The edit has been applied, the ETag header holds the new version')
+    @transactional(db.session)
+    def patch(self, category_id, page_id, _transaction, base, delta=None, patch=None):
+        """
+        ## Apply a delta or patch to the content of the page located at (category_id, page_id)
+        ***Requires Authentication***
+
+        base is the ETag of the content the edit was made on, the edit is rejected if the content has changed since
+        """
+        page: PageModel = PageModel.query.with_for_update().get_or_404((category_id, page_id))
+        old_content = get_content(page)
+        if unquote_etag(base)[0] != old_content.etag:
+            raise ConflictError('The content has been changed since base')
+        try:
+            if patch is not None:
+                delta = patch_to_delta(old_content.text, patch)
+            new_content = apply_delta(old_content.text, delta)
+        except ValueError as e:
+            raise RequestError(str(e))
+        metrics.observe('content.patch.size', len(delta))
+
+        add_change(_transaction.session, page, delta, new_content)
+        _transaction.session.flush()
+        content = rendered(new_content)
+        content_cache.store((category_id, page_id), content, version=page.version)
+        content_written(_transaction.session, category_id, page_id)
+        return Response(status=204, headers={'ETag': quote_etag(content.etag)})
+
+
+@tag('content')
+@params(category_id='The id of the category', page_id='The id of the page')
+class PageRevision(Resource):
+
+    @use_kwargs(RevisionFilterSchema, location='query')
+    @marshal_with({'type': 'string', 'format': 'markdown'}, code=200, content_type='text/markdown', apply=False)
+    def get(self, category_id, page_id, revision=None, at=None):
+        """
+        ## Get the content of the page located at (category_id, page_id) at a revision or point in time
+        The revision is the number of changes made to the page, 0 is the empty page
+        """
+        page: PageModel = PageModel.query.get_or_404((category_id, page_id))
+        if revision is None:
+            revision = revision_at(category_id, page_id, at)
+        content = render_revision(page, revision)
+        return content.text, 200, {'ETag': quote_etag(content.etag)}
 
 
 @tag('content')
 @params(category_id='The id of the category', page_id='The id of the page')
 class Changes(Resource):
 
-    @marshal_with(ChangeSchema, code=200)
-    def get(self, category_id, page_id):
+    @use_kwargs(PaginationSchema, location='query')
+    @marshal_with(ChangePageSchema, code=200, stream=True)
+    def get(self, category_id, page_id, limit=None, cursor=None):
         """
         ## Get the changes made to this pages content
         """
-        return ChangeModel.query.filter(ChangeModel.category == category_id, ChangeModel.page == page_id).all()
+        query = ChangeModel.query.filter(ChangeModel.category == category_id, ChangeModel.page == page_id)
+        return paginate(query, [ChangeModel.created_at], limit, cursor, stream=True)
 
     @marshal_with(None, code=204)
     @transactional(db.session)
@@ -91,11 +123,14 @@ class Changes(Resource):
         """
         ## Delete the last change made to this page
         """
+        page = PageModel.query.with_for_update().get_or_404((category_id, page_id))
         change = ChangeModel.query\
             .filter(ChangeModel.category == category_id, ChangeModel.page == page_id)\
-            .order_by(ChangeModel.created_at)\
+            .order_by(ChangeModel.created_at.desc())\
             .first_or_404()
         _transaction.session.delete(change)
+        page.bump_version()
+        content_written(_transaction.session, category_id, page_id)
         return {}, 204
 
 
@@ -161,6 +196,7 @@ class Page(Resource):
         """
         page = PageModel.query.get_or_404((category_id, page_id))
         _transaction.session.delete(page)
+        content_written(_transaction.session, category_id, page_id)
         return {}, 204
 
 
@@ -169,6 +205,7 @@ class Page(Resource):
 class Pages(Resource):
     __child__ = Page
 
+    @cache_response('category', 'page')
     @marshal_with(PageSchema(many=True), code=200)
     def get(self, category_id):
         """
@@ -253,6 +290,7 @@ class Category(Resource):
 class Categories(Resource):
     __child__ = Category
 
+    @cache_response('category')
     @marshal_with(CategorySchema(many=True), code=200)
     def get(self):
         """
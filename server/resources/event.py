@@ -4,10 +4,12 @@ from flask_jwt_extended import get_current_user
 
 from server.common.database import Event as EventModel
 from server.common.database import db
+from server.common.pagination import paginate
 from server.common.rest import Resource
-from server.common.schema import EventSchema, EventFilterSchema
+from server.common.schema import EventSchema, EventPageSchema, EventFilterSchema
 from server.common.util import AuthorisationError
-from server.common.util.decorators import tag, marshal_with, jwt_required, params, transactional, use_kwargs
+from server.common.util.decorators import tag, marshal_with, jwt_required, params, transactional, use_kwargs, \
+    cache_response
 from server.common.util.enums import Role
 
 
@@ -74,9 +76,10 @@ class Event(Resource):
 class Events(Resource):
     __child__ = Event
 
+    @cache_response('event', max_age=60)
     @use_kwargs(EventFilterSchema, location='query')
-    @marshal_with(EventSchema(many=True), code=200)
-    def get(self, start: datetime = None, end: datetime = None):
+    @marshal_with(EventPageSchema, code=200)
+    def get(self, start: datetime = None, end: datetime = None, limit=None, cursor=None):
         """
         ## Get all events between start and end
         """
@@ -92,7 +95,7 @@ class Events(Resource):
             end = now.replace(year=now.year + year, month=month)
         filters.append(EventModel.start < end)
         filters.append(EventModel.end > start)
-        return EventModel.query.filter(*filters).all()
+        return paginate(EventModel.query.filter(*filters), [EventModel.start, EventModel.__table__.c.id], limit, cursor)
 
     @jwt_required
     @use_kwargs(EventSchema)
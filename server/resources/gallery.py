@@ -3,10 +3,12 @@ from flask_apispec import use_kwargs
 from server.common.database import db
 from server.common.database.gallery import Gallery as GalleryModel
 from server.common.database.media import Media as MediaModel
+from server.common.pagination import paginate
 from server.common.rest import Resource
-from server.common.schema import GallerySchema, MediaIdSchema
+from server.common.schema import GallerySchema, GalleryPageSchema, MediaIdSchema, PaginationSchema
 from server.common.util import RequestError
-from server.common.util.decorators import tag, marshal_with, transactional, jwt_required, params, op_id
+from server.common.util.decorators import tag, marshal_with, transactional, jwt_required, params, op_id, \
+    cache_response
 
 __all__ = ['Galleries', 'Gallery']
 
@@ -85,12 +87,14 @@ class Gallery(Resource):
 class Galleries(Resource):
     __child__ = Gallery
 
-    @marshal_with(GallerySchema(many=True), code=200)
-    def get(self):
+    @cache_response('gallery', 'media')
+    @use_kwargs(PaginationSchema, location='query')
+    @marshal_with(GalleryPageSchema, code=200)
+    def get(self, limit=None, cursor=None):
         """
         ## Get all galleries
         """
-        return GalleryModel.query.all()
+        return paginate(GalleryModel.query, [GalleryModel.__table__.c.id], limit, cursor)
 
     @jwt_required
     @use_kwargs(GallerySchema)
@@ -1,17 +1,18 @@
 import os
 
-from flask import request, send_file
+from flask import current_app, request
 from flask_jwt_extended import get_current_user
 
 from server.common.database import db
 from server.common.database.media import Media as MediaModel
 from server.common.database.user import Role
+from server.common.media import media_processor, derived_cache
+from server.common.pagination import paginate
 from server.common.rest import Resource
-from server.common.schema import MediaSchema, FileSchema
-from server.common.tinify import tinify
-from server.common.util import AuthorisationError, use_kwargs
-from server.common.util.decorators import tag, marshal_with, jwt_required, transactional, params
-from server.common.util.file import get_save_path
+from server.common.schema import MediaSchema, MediaPageSchema, MediaFileSchema, FileSchema, PaginationSchema
+from server.common.util import AuthorisationError, RequestError, use_kwargs
+from server.common.util.decorators import tag, marshal_with, jwt_required, transactional, params, cache_response
+from server.common.util.file import get_save_path, send_media_file
 
 __all__ = ['Medias', 'Media', 'MediaData']
 
@@ -20,20 +21,56 @@ __all__ = ['Medias', 'Media', 'MediaData']
 @params(media_id='The id of the Media')
 class MediaData(Resource):
 
+    @use_kwargs(MediaFileSchema, location='query')
     @marshal_with({'type': 'string', 'format': 'binary'}, code=200, content_type='image/*')
     @marshal_with({'type': 'string', 'format': 'binary'}, code=200, content_type='video/*')
     @marshal_with({'type': 'string', 'format': 'binary'}, code=200, content_type='audio/*')
-    def get(self, media_id):
+    def get(self, media_id, variant=None, thumb=None, w=None, h=None, fit='contain'):
         """
         ## Get the file for the media with the id media_id
+
+        Images can be requested in one of the sizes of MEDIA_VARIANTS with the variant query argument,
+        thumb is the same as variant=thumb. Raster images can be scaled to other sizes with w and h, they are
+        scaled when they are requested for the first time and kept in a cache.
+
+        JPEG and PNG images are sent as AVIF or WebP to clients that list those types in their Accept header.
+
+        Files can be requested in ranges and are cached by the client as long as they are final.
         """
         media = MediaModel.query.get_or_404(media_id)
         mimetype = media.mimetype
         media_type = mimetype.split('/')[0]
         save_path = get_save_path(media_type)
-        if media_type == 'image' and 'thumb' in request.args:
-            return send_file(os.path.join(save_path, media.get_file_name(suffix='_thumb')), mimetype=media.mimetype)
-        return send_file(os.path.join(save_path, media.get_file_name()), mimetype=media.mimetype)
+        suffix = ''
+        if variant is None and thumb is not None:
+            variant = 'thumb'
+        if media_type == 'image' and variant is not None:
+            if w or h:
+                raise RequestError('A variant can not be combined with w and h')
+            try:
+                suffix = media_processor.variant_suffix(variant)
+            except KeyError:
+                raise RequestError(f'Unknown variant {variant}')
+        # until the upload is processed the original is served, images stored before their variants
+        # were rendered only have the full file
+        paths = [os.path.join(save_path, media.get_file_name(suffix=s)) for s in (suffix, '_original', '')]
+        path = next((path for path in paths if os.path.exists(path)), paths[0])
+        # files are never replaced once they are written, only a fallback changes when the requested one is ready
+        max_age = current_app.config.get('MEDIA_MAX_AGE', 31536000) if path == paths[0] else None
+        if media_type != 'image':
+            return send_media_file(path, mimetype, max_age=max_age)
+        if any(size and size not in derived_cache.sizes for size in (w, h)):
+            raise RequestError(f'w and h must be one of {", ".join(map(str, derived_cache.sizes))}')
+        if (w or h) and not derived_cache.resizable(media):
+            raise RequestError(f'Images of type {mimetype} can not be resized')
+        source = None
+        extension = derived_cache.negotiate(media, request.accept_mimetypes)
+        if w or h or extension:
+            source, path = path, derived_cache.get(media, path, w or None, h or None, fit, extension)
+        response = send_media_file(path, f'image/{extension}' if extension else mimetype, source, max_age)
+        if derived_cache.negotiable(media):
+            response.vary.add('Accept')
+        return response
 
 
 @tag('media')
@@ -67,9 +104,11 @@ class Media(Resource):
         mimetype = media.mimetype
         media_type = mimetype.split('/')[0]
         save_path = get_save_path(media_type)
+        for file_name in media_processor.file_names(media):
+            if os.path.exists(os.path.join(save_path, file_name)):
+                os.remove(os.path.join(save_path, file_name))
         if media_type == 'image':
-            os.remove(os.path.join(save_path, media.get_file_name(suffix='_thumb')))
-        os.remove(os.path.join(save_path, media.get_file_name()))
+            derived_cache.evict(media)
         return {}, 204
 
 
@@ -77,21 +116,27 @@ class Media(Resource):
 class Medias(Resource):
     __child__ = Media
 
-    @marshal_with(MediaSchema(many=True), code=200)
-    def get(self):
+    @cache_response('media')
+    @use_kwargs(PaginationSchema, location='query')
+    @marshal_with(MediaPageSchema, code=200)
+    def get(self, limit=None, cursor=None):
         """
         ## Get the media library
         """
-        return MediaModel.query.all()
+        return paginate(MediaModel.query, [MediaModel.__table__.c.id], limit, cursor)
 
     @jwt_required
     @use_kwargs(FileSchema, location='files')
     @marshal_with(MediaSchema, code=201)
+    @marshal_with(MediaSchema, code=202, description='The image is optimized in the background')
     @transactional(db.session)
     def post(self, file, _transaction):
         """
         ## Add a new file to the media library
         ***Requires Authentication***
+
+        Raster images are stored as uploaded and optimized in the background, their status is processing until the
+        optimized file and its resized variants are written.
         """
         filename = file.filename.split('.')
         ext = filename[-1]
@@ -102,19 +147,9 @@ class Medias(Resource):
         media = MediaModel(name=name, mimetype=mimetype, extension=ext)
         _transaction.session.add(media)
         _transaction.session.flush()
-        if media_type == 'image':
-            if tinify.key:
-                with file.stream as stream:
-                    src = tinify.from_buffer(stream.read())
-                    src.preserve("copyright")
-                    src.to_file(os.path.join(save_path, media.get_file_name()))
-                    thumb = src.resize(method="thumb",
-                                       width=150,
-                                       height=150)
-                    thumb.preserve("copyright")
-                    thumb.to_file(os.path.join(save_path, media.get_file_name('_thumb')))
-            else:
-                file.save(os.path.join(save_path, media.get_file_name()))
-        else:
-            file.save(os.path.join(save_path, media.get_file_name()))
+        if media_type == 'image' and derived_cache.resizable(media):
+            file.save(os.path.join(save_path, media.get_file_name('_original')))
+            media_processor.enqueue(media, _transaction.session)
+            return media, 202
+        file.save(os.path.join(save_path, media.get_file_name()))
         return media, 201
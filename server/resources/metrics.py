@@ -0,0 +1,21 @@
+import os
+
+from server.common.rest import Resource
+from server.common.util import CacheDict
+from server.common.util.decorators import tag, marshal_with, admin_required
+from server.common.util.metrics import metrics
+
+__all__ = ['Metrics']
+
+
+@tag('metrics')
+class Metrics(Resource):
+
+    @admin_required
+    @marshal_with({'type': 'object'}, code=200, apply=False)
+    def get(self):
+        """
+        ## Get the metrics collected by the worker process answering this request
+        ***Requires administrator rights***
+        """
+        return {'pid': os.getpid(), **metrics.snapshot(), 'caches': CacheDict.statistics()}
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from flask import current_app
+
+from server.common.database import db, Category as CategoryModel, Event as EventModel, Gallery as GalleryModel
+from server.common.database.gallery import gallery_media_relation
+from server.common.rest import Resource
+from server.common.schema import SiteSchema
+from server.common.util.decorators import tag, marshal_with, cache_response
+
+__all__ = ['Site']
+
+
+@tag('site')
+class Site(Resource):
+
+    @cache_response('category', 'page', 'event', 'gallery', 'media', max_age=60)
+    @marshal_with(SiteSchema, code=200)
+    def get(self):
+        """
+        ## Get the categories with their pages, the upcoming events and a summary of the galleries
+        Everything the frontend needs for the navigation and the home page in a single response
+        """
+        categories = CategoryModel.query \
+            .options(db.selectinload(CategoryModel.pages)) \
+            .order_by(CategoryModel.order) \
+            .all()
+        events = EventModel.query \
+            .filter(EventModel.end > datetime.now()) \
+            .order_by(EventModel.start) \
+            .limit(current_app.config.get('SITE_EVENTS', 10)) \
+            .all()
+        gallery = GalleryModel.__table__.c
+        galleries = db.session \
+            .query(gallery.id, gallery.title, gallery.owner_id,
+                   db.func.count(gallery_media_relation.c.media_id).label('media_count')) \
+            .outerjoin(gallery_media_relation, gallery_media_relation.c.gallery_id == gallery.id) \
+            .group_by(gallery.id, gallery.title, gallery.owner_id) \
+            .order_by(gallery.title) \
+            .all()
+        return {'categories': categories, 'events': events, 'galleries': galleries}
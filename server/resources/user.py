@@ -4,8 +4,9 @@ from flask_jwt_extended import (
 
 from server.common.database import User as UserModel
 from server.common.database import db
+from server.common.pagination import paginate
 from server.common.rest import Resource
-from server.common.schema import UserSchema, LoginSchema, TokenSchema
+from server.common.schema import UserSchema, UserPageSchema, LoginSchema, TokenSchema, PaginationSchema
 from server.common.util import AuthorisationError
 from server.common.util.decorators import (
     tag, marshal_with, use_kwargs, jwt_required, admin_required, transactional, params, op_id
@@ -100,13 +101,14 @@ class Users(Resource):
     __child__ = User
 
     @jwt_required
-    @marshal_with(UserSchema(many=True))
-    def get(self):
+    @use_kwargs(PaginationSchema, location='query')
+    @marshal_with(UserPageSchema)
+    def get(self, limit=None, cursor=None):
         """
         ## Get all users
         ***Requires Authentication***
         """
-        return UserModel.query.all()
+        return paginate(UserModel.query, [UserModel.__table__.c.id], limit, cursor)
 
     @admin_required
     @use_kwargs(UserSchema)
@@ -9,6 +9,63 @@ TINIFY_KEY = "PP5kKs2F5VPQp9sDxWX33SMv2kzjKN4M"
 LOG_LEVEL = "INFO"
 LOG_FORMAT = "[{name}] {levelname} {message}"
 
+# Content - Config
+CONTENT_CHECKPOINT_INTERVAL = 50
+CONTENT_CHECKPOINT_SIZE = 262144
+CONTENT_RETENTION_DAYS = 365
+CONTENT_DIFF_LINE_THRESHOLD = 20000
+CONTENT_DIFF_TIMEOUT = 0.5
+CONTENT_DIFF_LINE_TIMEOUT = 2.0
+
+# Pagination - Config
+PAGINATION_LIMIT = 50
+PAGINATION_MAX_LIMIT = 500
+STREAM_BATCH_SIZE = 100
+
+# Media - Config
+MEDIA_COMPRESSOR = "auto"
+MEDIA_WORKERS = 2
+MEDIA_PROCESSES = 1
+MEDIA_QUALITY = 85
+MEDIA_VARIANTS = {
+    "thumb": (150, 150, "cover"),
+    "medium": (800, 800, "contain"),
+    "large": (1600, 1600, "contain")
+}
+MEDIA_POLL_INTERVAL = 5.0
+MEDIA_JOB_TIMEOUT = 600
+MEDIA_JOB_ATTEMPTS = 3
+MEDIA_RETRY_DELAY = 60
+MEDIA_CACHE_MAX_BYTES = 512 * 1024 * 1024
+MEDIA_RESIZE_SIZES = (64, 128, 256, 320, 480, 640, 768, 1024, 1280, 1600, 1920, 2560, 3840)
+MEDIA_MAX_AGE = 31536000
+MEDIA_NEGOTIATED_FORMATS = ("avif", "webp")
+MEDIA_NEGOTIATED_TYPES = ("image/jpeg", "image/png")
+MEDIA_FORMAT_QUALITY = {
+    "avif": 60,
+    "webp": 80
+}
+
+# Site - Config
+SITE_EVENTS = 10
+
+# Cache - Config
+CACHE_BACKEND = "sqlite"
+CACHE_PATH = "./cache/cache.sqlite"
+CACHE_MAX_ENTRIES = 10000
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CACHE_EVICTION = "lru"
+CACHE_USAGE_INTERVAL = 60
+CACHE_USAGE_SAMPLE = 0.1
+CACHE_SNAPSHOT_PATH = "./cache/content.snapshot"
+CACHE_WARM_ON_START = True
+CACHE_WARM_PAGES = 100
+
+# Invalidation - Config
+INVALIDATION_BACKEND = "auto"
+INVALIDATION_POLL_INTERVAL = 1.0
+INVALIDATION_RETENTION = 3600
+
 # SQLAlchemy - Config
 SQLALCHEMY_TRACK_MODIFICATIONS = True
 SQLALCHEMY_DATABASE_URI = ""
@@ -0,0 +1,75 @@
+"""
+Measures the per request overhead of the view wrapper
+
+Resolving the annotations and schemas of a view on every request, as the wrapper used to, is compared with
+the pipelines that resolve them once per view.
+
+    python tests/benchmark.py [number of calls per view]
+"""
+import os
+import sys
+import timeit
+
+import flask
+from flask_apispec import utils
+from flask_apispec.wrapper import Wrapper as OriginalWrapper
+
+from server import create_app
+from server.common.util.decorators import get_pipeline
+
+
+def views(app):
+    for view in app.view_functions.values():
+        resource = getattr(view, 'view_class', None)
+        if resource is None:
+            continue
+        for method in ('get', 'put', 'post', 'patch', 'delete'):
+            func = getattr(getattr(resource, method, None), '__wrapped__', None)
+            if func is not None and hasattr(func, '__apispec__'):
+                yield f'{resource.__name__}.{method}', func, resource.__new__(resource)
+
+
+def status_code(func, instance):
+    schemas = utils.merge_recursive(utils.resolve_annotations(func, 'schemas', instance).options)
+    return next((code for code in schemas if code != 'default'), 'default')
+
+
+def per_request(func, instance, code):
+    annotation = utils.resolve_annotations(func, 'wrapper', instance)
+    utils.merge_recursive(annotation.options).get('wrapper', OriginalWrapper)(func, instance)
+    utils.merge_recursive(utils.resolve_annotations(func, 'response_cache', instance).options)
+    for option in utils.resolve_annotations(func, 'args', instance).options:
+        utils.resolve_schema(option['args'], request=flask.request)
+    # the schemas were resolved once to check for streaming and once more to marshal the result
+    for _ in range(2):
+        annotation = utils.resolve_annotations(func, 'schemas', instance)
+        schemas = utils.merge_recursive(annotation.options)
+        schema = schemas.get(code, schemas.get('default'))
+    if schema and schema['schema']:
+        utils.resolve_schema(schema['schema'], request=flask.request)
+
+
+def pipelined(func, instance, code):
+    pipeline = get_pipeline(func, instance)
+    pipeline.wrapper(func, instance, pipeline)
+    for schema, _ in pipeline.args:
+        utils.resolve_schema(schema, request=flask.request)
+    option, schema = pipeline.response(code)
+    if schema is not None:
+        utils.resolve_schema(schema, request=flask.request)
+
+
+if __name__ == '__main__':
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    os.environ.setdefault('APP_CONFIG', r'../settings-dev.json')
+    app = create_app()
+    totals = [0.0, 0.0]
+    with app.test_request_context('/'):
+        print(f'{"view":<32}{"per request":>14}{"pipeline":>14}')
+        for name, func, instance in sorted(views(app), key=lambda view: view[0]):
+            code = status_code(func, instance)
+            timings = [timeit.timeit(lambda: fn(func, instance, code), number=number) / number * 1e6
+                       for fn in (per_request, pipelined)]
+            totals = [total + timing for total, timing in zip(totals, timings)]
+            print(f'{name:<32}{timings[0]:>12.1f}us{timings[1]:>12.1f}us')
+        print(f'{"total":<32}{totals[0]:>12.1f}us{totals[1]:>12.1f}us')
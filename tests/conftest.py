@@ -0,0 +1,96 @@
+import shutil
+from datetime import timedelta
+
+import pytest
+
+from server import create_app
+from server.common.content import content_cache, revision_cache
+from server.common.database import db
+from server.common.database.change import Change
+from server.common.media import derived_cache
+from server.common.response_cache import response_cache
+from server.debug import create_debug_admin
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """
+    The app under test, the resources can only be registered on one app per process so it is shared by all tests
+    """
+    path = tmp_path_factory.mktemp('app')
+    settings = {
+        'ENV': 'development',
+        'DEBUG': True,
+        'TESTING': True,
+        'SECRET_KEY': 'test',
+        'FILE_STORE': str(path / 'files'),
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path / "db.sqlite"}',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'CORS': {},
+        'APISPEC_TITLE': 'Backend',
+        'APISPEC_VERSION': 'v1',
+        'APISPEC_OAS_VERSION': '3.0.2',
+        'CACHE_BACKEND': 'memory',
+        'CACHE_PATH': str(path / 'cache' / 'cache.sqlite'),
+        'CACHE_SNAPSHOT_PATH': str(path / 'cache' / 'content.snapshot'),
+        'CACHE_WARM_ON_START': False,
+        'INVALIDATION_BACKEND': None,
+        'MEDIA_COMPRESSOR': 'local',
+        'MEDIA_WORKERS': 0,
+    }
+    config = path / 'settings.py'
+    config.write_text(''.join(f'{key} = {value!r}\n' for key, value in settings.items()))
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv('APP_CONFIG', str(config))
+        return create_app()
+
+
+@pytest.fixture
+def client(app):
+    """
+    A client for the app with an empty database, file store and caches
+    """
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        create_debug_admin()
+    shutil.rmtree(app.config['FILE_STORE'], ignore_errors=True)
+    for cache in (content_cache, revision_cache):
+        cache.init_app(app)
+    response_cache.init_app(app)
+    derived_cache.init_app(app)
+    return app.test_client()
+
+
+@pytest.fixture
+def auth(client):
+    response = client.post('/api/login', json={'username': 'admin@debug.com', 'password': 'AdminPazz69'})
+    return {'Authorization': f'Bearer {response.get_json()["access_token"]}'}
+
+
+@pytest.fixture
+def write_content(app, client, auth):
+    """
+    Put new content on a page, the earlier changes are moved back a second as the change timestamps only have
+    second precision
+    """
+    def write(category_id, page_id, text):
+        with app.app_context():
+            for change in Change.query.filter_by(category=category_id, page=page_id):
+                change.created_at -= timedelta(seconds=1)
+            db.session.commit()
+        return client.put(f'/api/category/{category_id}/page/{page_id}/content', data=text.encode(), headers=auth)
+    return write
+
+
+@pytest.fixture
+def page(client, auth, write_content):
+    """
+    The page c/p with three revisions of content
+    """
+    client.post('/api/category', json={'id': 'c', 'title': 'C', 'order': 0}, headers=auth)
+    client.put('/api/category/c/page/p', json={'category': 'c', 'id': 'p', 'title': 'P', 'order': 0}, headers=auth)
+    for text in ('one\n', 'one\ntwo\n', 'one\ntwo\nthree\n'):
+        write_content('c', 'p', text)
+    return 'c', 'p'
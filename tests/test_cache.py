@@ -0,0 +1,175 @@
+import itertools
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from server.common.util import datastructures
+from server.common.util.datastructures import CacheDict, CacheResult, MemoryBackend, SQLiteBackend
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # every call is a second later, so the last use of the entries never ties
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(datastructures.time, 'time', lambda: float(next(ticks)))
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path, clock):
+    def make(**limits):
+        if request.param == 'memory':
+            return MemoryBackend(**limits)
+        return SQLiteBackend(str(tmp_path / 'cache.sqlite'), 'test', usage_interval=0, usage_sample=1, **limits)
+    return make
+
+
+def fill(cache, *keys):
+    for key in keys:
+        cache[key] = key * 10
+
+
+def test_lru_drops_the_least_recently_used(backend):
+    cache = CacheDict(None, backend=backend(max_entries=2))
+    fill(cache, 'a', 'b')
+    assert cache['a'] == 'a' * 10
+    fill(cache, 'c')
+    assert sorted(cache) == ['a', 'c']
+    assert cache.stats()['evictions'] == 1
+
+
+def test_lfu_drops_the_least_frequently_used(backend):
+    cache = CacheDict(None, backend=backend(max_entries=2, policy='lfu'))
+    fill(cache, 'a', 'b')
+    for _ in range(3):
+        cache['b']
+    cache['a']
+    fill(cache, 'c')
+    assert sorted(cache) == ['b', 'c']
+
+
+def test_size_limit(backend):
+    cache = CacheDict(None, backend=backend(max_bytes=150))
+    cache['big'] = 'x' * 100
+    cache['small'] = 'y'
+    assert len(cache) == 2
+    cache['other'] = 'z' * 100
+    assert sorted(cache) == ['other', 'small']
+    entries, size = cache.backend.size()
+    assert entries == 2 and size <= 150
+
+
+def test_tuple_keys(backend):
+    cache = CacheDict(None, backend=backend())
+    cache[('c', 'p')] = 'content'
+    assert list(cache) == [('c', 'p')]
+    assert cache[('c', 'p')] == 'content'
+    del cache[('c', 'p')]
+    assert ('c', 'p') not in cache
+
+
+def test_lookup_validates_the_version(backend):
+    cache = CacheDict(None, lambda key, content, cache_version, version: cache_version == version, backend=backend())
+    cache.store('a', 'value', version=1)
+    assert cache.lookup('a', version=1) == 'value'
+    assert cache.lookup('a', version=2) is None
+    assert cache.lookup('b', version=1) is None
+    assert {key: cache.stats()[key] for key in ('hits', 'misses')} == {'hits': 1, 'misses': 2}
+
+
+def test_sqlite_hits_only_record_the_use_after_the_interval(tmp_path, clock):
+    cache = CacheDict(None, backend=SQLiteBackend(str(tmp_path / 'cache.sqlite'), 'test', max_entries=2,
+                                                  usage_interval=60))
+    fill(cache, 'a', 'b')
+    # the hit on a is within the interval and not written, so a still counts as the oldest entry
+    cache['a']
+    fill(cache, 'c')
+    assert sorted(cache) == ['b', 'c']
+
+
+def test_sqlite_lfu_samples_the_hits(tmp_path, monkeypatch):
+    backend = SQLiteBackend(str(tmp_path / 'cache.sqlite'), 'test', max_entries=10, policy='lfu', usage_sample=0.25)
+    backend.set('a', 'value', 1)
+    used = lambda: backend.connection.execute('SELECT used FROM test').fetchone()[0]  # noqa: E731
+    monkeypatch.setattr(datastructures.random, 'random', lambda: 0.5)
+    backend.get('a')
+    assert used() == 1
+    monkeypatch.setattr(datastructures.random, 'random', lambda: 0.1)
+    backend.get('a')
+    assert used() == 5
+
+
+def test_sqlite_backend_is_shared(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    # two backends on the same file, as in two workers of the node
+    first, second = SQLiteBackend(path, 'test'), SQLiteBackend(path, 'test')
+    first.set(('c', 'p'), 'content', 3)
+    assert second.get(('c', 'p')) == ('content', 3)
+    assert second.delete(('c', 'p'))
+    assert first.get(('c', 'p')) is None
+    assert SQLiteBackend.shared and not MemoryBackend.shared
+
+
+def test_sqlite_backend_drops_an_old_layout(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE test (key TEXT PRIMARY KEY, value BLOB)')
+    connection.commit()
+    connection.close()
+    backend = SQLiteBackend(path, 'test')
+    backend.set('a', 'value', 1)
+    assert backend.get('a') == ('value', 1)
+
+
+def slow_cache(started, release, calls):
+    def compute(value):
+        calls.append(value)
+        started.set()
+        assert release.wait(5)
+        if value is None:
+            raise LookupError('missing')
+        return value
+    return CacheDict(compute)
+
+
+def test_concurrent_fills_compute_once():
+    started, release, calls = threading.Event(), threading.Event(), []
+    cache = slow_cache(started, release, calls)
+    with ThreadPoolExecutor(4) as pool:
+        results = [pool.submit(cache.get_or_compute, 'a', 'value', version=1) for _ in range(4)]
+        assert started.wait(5)
+        release.set()
+        assert [result.result() for result in results] == [CacheResult('value', False)] * 4
+    assert calls == ['value']
+    assert cache.stats()['misses'] == 1
+
+
+def test_waiting_fills_share_the_error():
+    started, release, calls = threading.Event(), threading.Event(), []
+    cache = slow_cache(started, release, calls)
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(cache.get_or_compute, 'a', None, version=1)
+        assert started.wait(5)
+        follower = pool.submit(cache.get_or_compute, 'a', None, version=1)
+        release.set()
+        for result in (leader, follower):
+            with pytest.raises(LookupError):
+                result.result()
+    assert calls == [None]
+    assert 'a' not in cache
+
+
+def test_stale_value_while_filling():
+    started, release, calls = threading.Event(), threading.Event(), []
+    cache = slow_cache(started, release, calls)
+    cache.validate_fn = lambda key, content, cache_version, version: cache_version == version
+    cache.store('a', 'old', version=1)
+    with ThreadPoolExecutor(1) as pool:
+        leader = pool.submit(cache.get_or_compute, 'a', 'new', version=2, validate={'version': 2})
+        assert started.wait(5)
+        assert cache.get_or_compute('a', 'new', version=2, stale=True, validate={'version': 2}) == \
+            CacheResult('old', True)
+        release.set()
+        assert leader.result() == CacheResult('new', False)
+    assert cache.lookup('a', version=2) == 'new'
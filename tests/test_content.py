@@ -0,0 +1,54 @@
+import pytest
+
+from server.common.content import apply_change, apply_delta, diff_content, diff_maker, patch_to_delta
+
+EDITS = [
+    ('', 'Grüß Gott 🙏\n'),
+    ('Messe 🎉 am Sonntag\n', 'Messe 🎉🎶 am Sonntag und 🕯 Montag\n'),
+    ('😀😀😀 unchanged 😀\n', '😀😀 changed 😀😀\n'),
+    ('𝔘𝔫𝔦𝔠𝔬𝔡𝔢', '𝔘𝔫𝔦 𝔠𝔬𝔡𝔢 ✝'),
+    ('text before 🙂', ''),
+]
+
+
+@pytest.fixture
+def config(app):
+    with app.app_context():
+        yield app.config
+
+
+@pytest.mark.parametrize('old, new', EDITS)
+def test_delta_round_trip(config, old, new):
+    assert apply_change(old, diff_content(old, new)) == new
+
+
+def test_delta_counts_utf16_units(config):
+    # the JavaScript client reads the lengths in UTF-16 code units, an emoji is two of them
+    assert diff_content('🙏a', '🙏b') == '=2\t-1\t+b'
+
+
+@pytest.mark.parametrize('old, new', EDITS)
+def test_line_mode_round_trip(config, monkeypatch, old, new):
+    old, new = (old + '\n') * 500, (new + '\n') * 250 + (old + '\n') * 250
+    monkeypatch.setitem(config, 'CONTENT_DIFF_LINE_THRESHOLD', 1000)
+    assert len(old) + len(new) > 1000
+    assert apply_change(old, diff_content(old, new)) == new
+
+
+@pytest.mark.parametrize('old, new', EDITS)
+def test_patch_round_trip(config, old, new):
+    patch = diff_maker.patch_toText(diff_maker.patch_make(old, new))
+    assert apply_delta(old, patch_to_delta(old, patch)) == new
+
+
+def test_patch_from_javascript_offsets(config):
+    # the JavaScript library counts the patch offsets in UTF-16 code units
+    old, new = '🙏🙏🙏 alpha beta gamma', '🙏🙏🙏 alpha BETA gamma'
+    patch = '@@ -10,12 +10,12 @@\n pha \n-beta\n+BETA\n  gam\n'
+    assert apply_delta(old, patch_to_delta(old, patch)) == new
+
+
+def test_patch_that_does_not_apply(config):
+    patch = diff_maker.patch_toText(diff_maker.patch_make('completely different', 'text'))
+    with pytest.raises(ValueError):
+        patch_to_delta('something else entirely', patch)
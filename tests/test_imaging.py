@@ -0,0 +1,32 @@
+import pytest
+from PIL import Image
+
+from server.common.imaging import render
+
+COPYRIGHT, ARTIST = 0x8298, 0x013B
+
+
+@pytest.fixture
+def photo(tmp_path):
+    path = tmp_path / 'photo.jpg'
+    exif = Image.Exif()
+    exif[COPYRIGHT] = 'Pfarre Machstrasse'
+    exif[ARTIST] = 'Someone'
+    Image.new('RGB', (400, 200), (200, 10, 10)).save(path, exif=exif.tobytes())
+    return path
+
+
+@pytest.mark.parametrize('extension', ['jpg', 'png', 'webp'])
+def test_only_the_copyright_is_kept(tmp_path, photo, extension):
+    target = tmp_path / f'variant.{extension}'
+    render(str(photo), str(target), (100, None, 'contain'))
+    with Image.open(target) as image:
+        assert image.size == (100, 50)
+        assert dict(image.getexif()) == {COPYRIGHT: 'Pfarre Machstrasse'}
+
+
+def test_cover_is_cropped(tmp_path, photo):
+    target = tmp_path / 'thumb.jpg'
+    render(str(photo), str(target), (150, 150, 'cover'))
+    with Image.open(target) as image:
+        assert image.size == (150, 150)
@@ -0,0 +1,110 @@
+import socket
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from server.common.content import content_cache, add_change, diff_content
+from server.common.database import db, Invalidation, User
+from server.common.database.page import Page
+from server.common.invalidation import InvalidationBus, bus
+
+CONTENT = '/api/category/c/page/p/content'
+
+
+@pytest.fixture
+def listening(monkeypatch):
+    """
+    Pretend the bus of this worker is connected, the tests deliver the messages themselves
+    """
+    monkeypatch.setattr(InvalidationBus, 'generation', 1)
+
+
+@contextmanager
+def queries(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def write_elsewhere(app, text):
+    """
+    Write new content like a worker on another node, without any message reaching this one
+    """
+    with app.app_context(), db.session.no_autoflush:
+        page = Page.query.get(('c', 'p'))
+        change = add_change(db.session, page, diff_content('one\ntwo\nthree\n', text), text)
+        change.author = User.query.first().id
+        change.created_at = datetime.utcnow() + timedelta(seconds=1)
+        db.session.commit()
+
+
+def test_trusted_content_is_read_without_the_database(app, client, page, listening):
+    assert client.get(CONTENT).data == b'one\ntwo\nthree\n'
+    with queries(app) as statements:
+        assert client.get(CONTENT).data == b'one\ntwo\nthree\n'
+    assert not [statement for statement in statements if 'page' in statement]
+
+
+def test_content_is_checked_while_the_bus_is_not_listening(app, client, page):
+    client.get(CONTENT)
+    write_elsewhere(app, 'elsewhere\n')
+    assert client.get(CONTENT).data == b'elsewhere\n'
+
+
+def test_published_change_evicts_the_content(app, client, page, listening):
+    client.get(CONTENT)
+    write_elsewhere(app, 'elsewhere\n')
+    # nothing told this worker about the write yet
+    assert client.get(CONTENT).data == b'one\ntwo\nthree\n'
+    bus.deliver('change', ['c', 'p', '2021-01-01 00:00:00'], 'other-node:1')
+    assert client.get(CONTENT).data == b'elsewhere\n'
+
+
+def test_page_metadata_writes_keep_the_content(app, client, page, listening):
+    client.get(CONTENT)
+    bus.deliver('page', ['c', 'p'], 'other-node:1')
+    with queries(app) as statements:
+        client.get(CONTENT)
+    assert not [statement for statement in statements if 'page' in statement]
+
+
+def test_own_writes_are_read_back(client, auth, page, write_content, listening):
+    client.get(CONTENT)
+    write_content('c', 'p', 'mine\n')
+    assert client.get(CONTENT).data == b'mine\n'
+    assert client.delete('/api/category/c/page/p/changes', headers=auth).status_code == 204
+    assert client.get(CONTENT).data == b'one\ntwo\nthree\n'
+
+
+def test_shared_cache_is_only_evicted_for_other_nodes(app, client, page, listening):
+    content_cache.init_app(app, backend='sqlite')
+    client.get(CONTENT)
+    bus.deliver('content', ['c', 'p'], f'{socket.gethostname()}:1')
+    assert ('c', 'p') in content_cache
+    bus.deliver('content', ['c', 'p'], 'other-node:1')
+    assert ('c', 'p') not in content_cache
+
+
+def test_own_messages_are_not_delivered(app, client, page):
+    client.get(CONTENT)
+    bus.deliver('content', ['c', 'p'], bus._origin())
+    assert ('c', 'p') in content_cache
+
+
+def test_writes_are_published_with_the_transaction(app, client, page, write_content, monkeypatch):
+    monkeypatch.setattr(bus, 'transport', 'polling')
+    assert write_content('c', 'p', 'published\n').status_code == 201
+    with app.app_context():
+        messages = {(message.topic, tuple(message.key[:2])) for message in Invalidation.query}
+    assert ('content', ('c', 'p')) in messages
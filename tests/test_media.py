@@ -0,0 +1,92 @@
+import io
+import os
+
+from PIL import Image
+
+from server.common import media
+from server.common.media import TinifyCompressor, derived_cache
+
+
+class FakeSource:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def preserve(self, *options):
+        self.calls.append(('preserve', options))
+        return self
+
+    def to_buffer(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (400, 200)).save(buffer, 'JPEG')
+        return buffer.getvalue()
+
+
+def test_tinify_only_compresses_the_full_image(tmp_path, monkeypatch):
+    calls = []
+
+    def from_file(path):
+        calls.append(('from_file', path))
+        return FakeSource(calls)
+
+    monkeypatch.setattr(media.tinify, 'from_file', from_file, raising=False)
+    source = tmp_path / 'original.jpg'
+    Image.new('RGB', (400, 200), (200, 10, 10)).save(source)
+    compressor = TinifyCompressor()
+    try:
+        compressor.process(str(source), [(str(tmp_path / 'full.jpg'), None),
+                                         (str(tmp_path / 'thumb.jpg'), (150, 150, 'cover'))])
+    finally:
+        compressor.pool.shutdown()
+    assert calls == [('from_file', str(source)), ('preserve', ('copyright',))]
+    with Image.open(tmp_path / 'thumb.jpg') as image:
+        assert image.size == (150, 150)
+
+
+def upload(client, auth, name, mimetype, data):
+    response = client.post('/api/media', data={'file': (io.BytesIO(data), name, mimetype)}, headers=auth,
+                           content_type='multipart/form-data')
+    return response.status_code, response.get_json()['id']
+
+
+def png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (400, 200), (200, 10, 10)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"><rect width="10" height="10"/></svg>'
+
+
+def test_images_are_resized_to_the_configured_sizes(app, client, auth):
+    status, media_id = upload(client, auth, 'photo.png', 'image/png', png())
+    assert status == 202
+    response = client.get(f'/api/media/{media_id}/file?w=320')
+    assert response.status_code == 200
+    assert Image.open(io.BytesIO(response.data)).size == (320, 160)
+    assert client.get(f'/api/media/{media_id}/file?w=300').status_code == 400
+
+
+def test_vector_images_are_not_resized(client, auth):
+    status, media_id = upload(client, auth, 'logo.svg', 'image/svg+xml', SVG)
+    assert status == 201
+    assert client.get(f'/api/media/{media_id}/file?w=320').status_code == 400
+    response = client.get(f'/api/media/{media_id}/file', headers={'Accept': 'image/avif,image/webp,*/*'})
+    assert response.status_code == 200
+    assert response.mimetype == 'image/svg+xml'
+    assert response.data == SVG
+
+
+def test_eviction_keeps_the_lock_files(app, client):
+    with app.app_context():
+        path = derived_cache.path
+        os.makedirs(path, exist_ok=True)
+        for name in ('a.png', 'b.png'):
+            with open(os.path.join(path, name), 'wb') as file:
+                file.write(b'x' * 100)
+            open(os.path.join(path, f'.{name}.lock'), 'w').close()
+        derived_cache.max_bytes = 150
+        try:
+            derived_cache._evict()
+        finally:
+            derived_cache.init_app(app)
+        assert sorted(os.listdir(path)) == ['.a.png.lock', '.b.png.lock', 'b.png']
@@ -0,0 +1,84 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from server.common.database import db, Event, User
+from server.common.pagination import decode_cursor, encode_cursor
+
+
+EVENTS = '/api/event?start=2029-12-31T00:00:00&end=2030-01-03T00:00:00'
+
+
+def cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+@pytest.fixture
+def events(app, client):
+    start = datetime(2030, 1, 1)
+    with app.app_context():
+        owner = User.query.first().id
+        for index in range(5):
+            db.session.add(Event(name=f'E{index}', details='', start=start + timedelta(hours=index % 2),
+                                 end=start + timedelta(days=1), owner_id=owner))
+        db.session.commit()
+
+
+def walk(client, url):
+    names, pages = [], 0
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        document = response.get_json()
+        names += [item['name'] for item in document['items']]
+        pages += 1
+        url = document['_links'].get('next')
+    return names, pages
+
+
+def test_cursor_round_trip(app, client):
+    columns = [Event.start, Event.__table__.c.id]
+    with app.app_context():
+        event = Event(name='E', details='', start=datetime(2030, 1, 1, 12, 30), end=datetime(2030, 1, 2),
+                      owner_id=User.query.first().id)
+        db.session.add(event)
+        db.session.flush()
+        assert decode_cursor(encode_cursor(event, columns), columns) == (event.start, event.id)
+        db.session.rollback()
+
+
+def test_pages_hold_every_item_once(client, events):
+    names, pages = walk(client, f'{EVENTS}&limit=2')
+    assert sorted(names) == [f'E{index}' for index in range(5)]
+    assert pages == 3
+
+
+def test_last_page_has_no_next(client, events):
+    document = client.get(f'{EVENTS}&limit=5').get_json()
+    assert len(document['items']) == 5
+    assert 'next' not in document['_links']
+
+
+@pytest.mark.parametrize('value', [
+    'not a cursor!',
+    'bm90IGpzb24',
+    cursor(['2030-01-01T00:00:00']),
+    cursor(['not a date', 'ffffffffffffffffffffffffffffffff']),
+    cursor(['2030-01-01T00:00:00', 'not a uuid']),
+    cursor(['2030-01-01T00:00:00', 12]),
+    cursor(['2030-01-01T00:00:00', ['f' * 32]]),
+    cursor([12, None]),
+    cursor({'start': 1}),
+])
+def test_malformed_cursor(client, events, value):
+    response = client.get(f'{EVENTS}&cursor={value}')
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Invalid cursor'
+
+
+@pytest.mark.parametrize('value', [cursor([12]), cursor([None]), cursor([{'id': 1}])])
+def test_malformed_streamed_cursor(client, value):
+    response = client.get(f'/api/category/c/page/p/changes?cursor={value}')
+    assert response.status_code == 400
@@ -0,0 +1,81 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from server.common import response_cache as response_cache_module
+from server.common.database import db
+from server.common.invalidation import bus
+
+GALLERIES = '/api/galleries'
+
+
+@contextmanager
+def queries(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def titles(response):
+    assert response.status_code == 200
+    return [gallery['title'] for gallery in response.get_json()['items']]
+
+
+@pytest.fixture
+def gallery(client, auth):
+    assert client.post(GALLERIES, json={'title': 'Pfarrfest'}, headers=auth).status_code == 201
+
+
+def test_anonymous_reads_are_cached(app, client, gallery):
+    first = client.get(GALLERIES)
+    with queries(app) as statements:
+        second = client.get(GALLERIES)
+    assert not statements
+    assert second.data == first.data
+    assert titles(second) == ['Pfarrfest']
+
+
+def test_writes_are_read_back(client, auth, gallery):
+    assert titles(client.get(GALLERIES)) == ['Pfarrfest']
+    client.post(GALLERIES, json={'title': 'Firmung'}, headers=auth)
+    assert sorted(titles(client.get(GALLERIES))) == ['Firmung', 'Pfarrfest']
+
+
+def test_published_writes_evict_the_responses(app, client, gallery):
+    client.get(GALLERIES)
+    with app.app_context():
+        # written by another worker, which only tells this one on the bus
+        db.engine.execute("UPDATE gallery SET title = 'Erstkommunion'")
+    assert titles(client.get(GALLERIES)) == ['Pfarrfest']
+    bus.deliver('gallery', ['any'], 'other-node:1')
+    assert titles(client.get(GALLERIES)) == ['Erstkommunion']
+
+
+def test_authorized_reads_bypass_the_cache(app, client, auth, gallery):
+    client.get(GALLERIES)
+    with queries(app) as statements:
+        assert titles(client.get(GALLERIES, headers=auth)) == ['Pfarrfest']
+    assert statements
+
+
+def test_responses_expire_after_max_age(app, client, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache_module.time, 'monotonic', lambda: now[0])
+    client.get('/api/event')
+    with queries(app) as statements:
+        client.get('/api/event')
+    assert not statements
+    now[0] += 61
+    with queries(app) as statements:
+        client.get('/api/event')
+    assert statements
@@ -0,0 +1,41 @@
+import multiprocessing
+import time
+
+from server.common import content
+from server.common.content import save_snapshot, warm_content, page_requests
+
+
+def test_snapshot_keeps_the_requests_of_workers_exiting_together(app, client, page, tmp_path, monkeypatch):
+    path = str(tmp_path / 'content.snapshot')
+    read = content._read_snapshot
+
+    def slow_read(path):
+        # widens the window between reading and replacing the file
+        snapshot = read(path)
+        time.sleep(0.2)
+        return snapshot
+
+    monkeypatch.setattr(content, '_read_snapshot', slow_read)
+    page_requests.clear()
+
+    def worker_exit():
+        with app.app_context():
+            page_requests[('c', 'p')] += 1
+            save_snapshot(path)
+
+    workers = [multiprocessing.get_context('fork').Process(target=worker_exit) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert read(path)[('c', 'p')]['requests'] == 4
+
+
+def test_warm_loads_the_snapshot(app, client, page, tmp_path):
+    path = str(tmp_path / 'content.snapshot')
+    client.get('/api/category/c/page/p/content')
+    with app.app_context():
+        save_snapshot(path)
+        content.content_cache.init_app(app)
+        assert warm_content(path=path) == (1, 0)
+    assert content.content_cache.lookup(('c', 'p'), page_version=3).text == 'one\ntwo\nthree\n'
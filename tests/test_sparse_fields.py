@@ -0,0 +1,27 @@
+def test_fields_limit_the_items(client, page):
+    response = client.get('/api/category/c/page?fields=id,title')
+    assert response.status_code == 200
+    assert [set(page) for page in response.get_json()] == [{'id', 'title'}]
+
+
+def test_links_can_be_left_out(client, page):
+    response = client.get('/api/category/c/page?links=false')
+    assert response.status_code == 200
+    assert '_links' not in response.get_json()[0]
+
+
+def test_unknown_field_of_paginated_items(client):
+    response = client.get('/api/media?fields=nope')
+    assert response.status_code == 400
+
+
+def test_unknown_field_of_streamed_items(client, page):
+    response = client.get('/api/category/c/page/p/changes?fields=nope')
+    assert response.status_code == 400
+    assert response.get_json()['status'] == 400
+
+
+def test_streamed_items_are_limited(client, page):
+    response = client.get('/api/category/c/page/p/changes?fields=created_at')
+    assert response.status_code == 200
+    assert all(set(item) == {'created_at'} for item in response.get_json()['items'])
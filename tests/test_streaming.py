@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from server.common.util import JSONEncoder
+
+CHANGES = '/api/category/c/page/p/changes'
+
+
+def formatted(response, **settings):
+    # how flask-restful would have written the same document
+    return json.dumps(json.loads(response.data), **settings) + '\n'
+
+
+@pytest.fixture
+def restful_json(app, monkeypatch):
+    def configure(debug, **settings):
+        monkeypatch.setitem(app.config, 'DEBUG', debug)
+        monkeypatch.setitem(app.config, 'RESTFUL_JSON', {'cls': JSONEncoder, **settings})
+    return configure
+
+
+def test_streamed_items_are_indented_in_debug(client, page, restful_json):
+    restful_json(True)
+    response = client.get(f'{CHANGES}?limit=2')
+    assert response.is_streamed
+    assert response.get_data(as_text=True) == formatted(response, indent=4)
+    assert len(response.get_json()['items']) == 2
+
+
+def test_streamed_items_are_compact(client, page, restful_json):
+    restful_json(False)
+    response = client.get(CHANGES)
+    assert response.get_data(as_text=True) == formatted(response)
+
+
+def test_streamed_items_follow_the_json_settings(client, page, restful_json):
+    settings = {'sort_keys': True, 'separators': (',', ':')}
+    restful_json(False, **settings)
+    response = client.get(CHANGES)
+    document = response.get_json()
+    # the links of the envelope follow the items, they are only known once the items were streamed
+    items, links = (json.dumps(document[key], **settings) for key in ('items', '_links'))
+    assert response.get_data(as_text=True) == f'{{"items":{items},"_links":{links}}}\n'
+    assert list(document['items'][0]) == sorted(document['items'][0])
+
+
+def test_empty_stream(client, auth, page, restful_json):
+    restful_json(True)
+    client.put('/api/category/c/page/q', json={'category': 'c', 'id': 'q', 'title': 'Q', 'order': 1}, headers=auth)
+    response = client.get('/api/category/c/page/q/changes')
+    assert response.get_json()['items'] == []
+    assert response.get_data(as_text=True) == formatted(response, indent=4)